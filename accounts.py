@@ -0,0 +1,118 @@
+from flask import current_app
+from sqlalchemy import or_
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from models import db, Buyer, User, Vendor
+
+
+USER_TYPES = ('buyer', 'vendor', 'both')
+
+# PASSWORD_HASH_METHOD -> the method prefix werkzeug writes for it
+_hash_prefixes = {}
+
+
+class AccountError(ValueError):
+    pass
+
+
+def init_app(app):
+    # any werkzeug method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"
+    app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config.setdefault('PASSWORD_SALT_LENGTH', 16)
+
+
+def hash_password(password):
+    config = current_app.config
+    return generate_password_hash(password, config['PASSWORD_HASH_METHOD'], config['PASSWORD_SALT_LENGTH'])
+
+
+def _needs_rehash(stored):
+    # True when the hash was made with other parameters than configured now
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    prefix = _hash_prefixes.get(method)
+    if prefix is None:
+        prefix = _hash_prefixes[method] = hash_password('').split('$', 1)[0]
+    return stored.split('$', 1)[0] != prefix
+
+
+def register(username, email, password, user_type):
+    # One lookup covers both the email and the username, and the password
+    # is hashed once whichever profiles the user gets.
+    if user_type not in USER_TYPES:
+        raise AccountError("Invalid user_type!")
+    if not username or not email or not password:
+        raise AccountError("username, email and password are required!")
+
+    existing = User.query.filter(or_(User.email == email, User.username == username)).first()
+    if existing:
+        if existing.email == email:
+            raise AccountError("User with this email already exists!")
+        raise AccountError("Username is already taken!")
+
+    user = User(username=username, email=email, password=hash_password(password))
+    if user_type in ('buyer', 'both'):
+        user.buyer = Buyer(username=username, email=email)
+    if user_type in ('vendor', 'both'):
+        user.vendor = Vendor(username=username, email=email)
+    db.session.add(user)
+    return user
+
+
+def authenticate(email, password):
+    # (user, user_type) or (None, None). One indexed lookup and one hash
+    # check, two for a user who still has a separate vendor_password.
+    user = User.query.filter_by(email=email).first()
+    if user is None or not password:
+        return None, None
+
+    buyer_ok = check_password_hash(user.password, password)
+    if user.vendor_password is None:
+        if not buyer_ok:
+            return None, None
+        user_type = user.user_type
+    else:
+        # each password opens its own profile, as before the merge; one
+        # that opens both shows they are the same and becomes the only one
+        vendor_ok = check_password_hash(user.vendor_password, password)
+        if buyer_ok and vendor_ok:
+            user.vendor_password = None
+            user_type = user.user_type
+        elif buyer_ok:
+            user_type = 'buyer'
+        elif vendor_ok:
+            user_type = 'vendor'
+        else:
+            return None, None
+
+    # move old hashes onto the current parameters while we have the password
+    if buyer_ok and _needs_rehash(user.password):
+        user.password = hash_password(password)
+    elif not buyer_ok and _needs_rehash(user.vendor_password):
+        user.vendor_password = hash_password(password)
+    if db.session.dirty:
+        db.session.commit()
+    return user, user_type
+
+
+def identity_for(user, user_type=None):
+    # user_type narrows the identity to the profile a login opened
+    user_type = user_type or user.user_type
+    return {
+        "id": user.id,
+        "user_type": user_type,
+        "buyer_id": user.buyer_id if user_type in ('buyer', 'both') else None,
+        "vendor_id": user.vendor_id if user_type in ('vendor', 'both') else None,
+    }
+
+
+def buyer_id_of(identity):
+    if 'buyer_id' in identity:
+        return identity['buyer_id']
+    # tokens issued before the users table carried the profile id as "id"
+    return identity['id'] if identity.get('user_type') in ('buyer', 'both') else None
+
+
+def vendor_id_of(identity):
+    if 'vendor_id' in identity:
+        return identity['vendor_id']
+    return identity['id'] if identity.get('user_type') in ('vendor', 'both') else None
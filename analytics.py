@@ -0,0 +1,128 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Order, VendorSalesRollup, utcnow
+
+
+PERIODS = ('day', 'week', 'month')
+
+UPSERT_DIALECTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def period_start(period, moment):
+    day = moment.date()
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _add(vendor_id, status, moment, count, revenue):
+    # adds to the vendor's day, week and month buckets for this status
+    rows = [
+        {
+            'vendor_id': vendor_id,
+            'period': period,
+            'period_start': period_start(period, moment),
+            'status': status,
+            'order_count': count,
+            'revenue': revenue,
+        }
+        for period in PERIODS
+    ]
+    table = VendorSalesRollup.__table__
+
+    dialect_insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.vendor_id, table.c.period, table.c.period_start, table.c.status],
+            set_={
+                'order_count': table.c.order_count + statement.excluded.order_count,
+                'revenue': table.c.revenue + statement.excluded.revenue,
+            },
+        )
+        db.session.execute(statement, rows)
+        return
+
+    for row in rows:
+        updated = db.session.execute(
+            update(table)
+            .where(
+                table.c.vendor_id == row['vendor_id'],
+                table.c.period == row['period'],
+                table.c.period_start == row['period_start'],
+                table.c.status == row['status'],
+            )
+            .values(order_count=table.c.order_count + count, revenue=table.c.revenue + revenue)
+        ).rowcount
+        if not updated:
+            db.session.execute(insert(table), row)
+
+
+def record_order(order, status=None):
+    # counts a new order in its vendor's rollups, in the caller's transaction
+    _add(order.vendor_id, status or order.status, order.created_at or utcnow(), 1, order.total_price)
+
+
+def forget_order(order, status=None):
+    _add(order.vendor_id, status or order.status, order.created_at or utcnow(), -1, -order.total_price)
+
+
+def move_order(order, old_status, new_status):
+    forget_order(order, old_status)
+    record_order(order, new_status)
+
+
+def rebuild_rollups(batch_size=1000):
+    # recomputes every bucket from the orders table, for backfills
+    totals = defaultdict(lambda: [0, 0.0])
+    rows = db.session.query(Order.vendor_id, Order.status, Order.created_at, Order.total_price).yield_per(batch_size)
+    for vendor_id, status, created_at, total_price in rows:
+        for period in PERIODS:
+            bucket = totals[(vendor_id, period, period_start(period, created_at), status)]
+            bucket[0] += 1
+            bucket[1] += total_price
+
+    db.session.execute(delete(VendorSalesRollup.__table__))
+    buckets = [
+        {
+            'vendor_id': vendor_id,
+            'period': period,
+            'period_start': start,
+            'status': status,
+            'order_count': count,
+            'revenue': revenue,
+        }
+        for (vendor_id, period, start, status), (count, revenue) in totals.items()
+    ]
+    for offset in range(0, len(buckets), batch_size):
+        db.session.execute(insert(VendorSalesRollup.__table__), buckets[offset:offset + batch_size])
+    return len(buckets)
+
+
+def vendor_analytics(vendor_id, period, start=None, end=None):
+    query = VendorSalesRollup.query.filter_by(vendor_id=vendor_id, period=period)
+    if start is not None:
+        query = query.filter(VendorSalesRollup.period_start >= period_start(period, start))
+    if end is not None:
+        query = query.filter(VendorSalesRollup.period_start <= end.date())
+
+    buckets = {}
+    for row in query.order_by(VendorSalesRollup.period_start):
+        bucket = buckets.setdefault(row.period_start, {
+            'period_start': row.period_start.isoformat(),
+            'order_count': 0,
+            'revenue': 0.0,
+            'statuses': {},
+        })
+        if not row.order_count:
+            continue
+        bucket['order_count'] += row.order_count
+        bucket['revenue'] = round(bucket['revenue'] + row.revenue, 2)
+        bucket['statuses'][row.status] = {'order_count': row.order_count, 'revenue': round(row.revenue, 2)}
+    return [bucket for bucket in buckets.values() if bucket['order_count']]
@@ -1,104 +1,131 @@
 from flask import Flask, make_response, request, jsonify
 from flask_migrate import Migrate
 from models import *
-from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token, jwt_required, get_jwt
+import accounts
+from accounts import AccountError, buyer_id_of, vendor_id_of
+from engine_profile import configure_engines, replica_reads
+from pagination import PaginationError, parse_limit, parse_number, parse_sort, keyset_page, encode_cursor, decode_cursor, is_int64
+from search import product_search
+from revocation import revocation_cache
+from response_cache import response_cache
+from bulk_import import iter_rows, import_products
+from cart_updates import CartUpdateError, apply_cart_changes
+from streaming import wants_stream, stream_response
+from checkout import CheckoutError, checkout_cart
+from catalog_sync import (
+    CursorExpiredError, parse_since, catalog_changes, catalog_version, record_deletion, prune_tombstones,
+)
+from inventory import InventoryError, OutOfStockError, stock_levels, set_stock, adjust_stock, set_vendor_stock
+from ratings import RatingError, validate_rating, apply_rating_change, rebuild_ratings
+from metrics import request_metrics
+from serializers import FieldError, configure_json
+from analytics import PERIODS, record_order, forget_order, rebuild_rollups, vendor_analytics
+from jobs import job_queue
+from batch import BatchError, batch_dispatcher
+from order_workflow import TRANSITIONS, OrderStatusError, order_placed, order_deleted, change_status
+from order_events import TICKET_SCOPE, order_events
+from rate_limit import RequestJWTManager, rate_limiter
+from loaders import load_profile
+from datetime import datetime
+from flask_jwt_extended import (
+    create_access_token, create_refresh_token, jwt_required, get_jwt, get_jwt_request_location,
+)
 from flask_cors import CORS
+from sqlalchemy.orm import load_only
 from dotenv import load_dotenv
+import click
+import csv
 import os
 
 load_dotenv()
 
 
+def env_flag(name):
+    return os.environ[name].lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_mapping(name, convert=str):
+    # "login=5/minute,checkout=30/minute" -> {'login': '5/minute', 'checkout': '30/minute'}
+    pairs = (item.split('=', 1) for item in os.environ[name].split(',') if item.strip())
+    return {key.strip(): convert(value.strip()) for key, value in pairs}
+
+
 app = Flask(__name__)
 
 
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("SQLALCHEMY_DATABASE_URI")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.environ.get("JWT_SECRET_KEY")
+app.config['BULK_IMPORT_BATCH_SIZE'] = int(os.environ.get("BULK_IMPORT_BATCH_SIZE", 500))
+if os.environ.get("RATE_LIMIT_ENABLED"):
+    app.config['RATE_LIMIT_ENABLED'] = env_flag("RATE_LIMIT_ENABLED")
+if os.environ.get("RATE_LIMIT_STORAGE"):
+    app.config['RATE_LIMIT_STORAGE'] = os.environ["RATE_LIMIT_STORAGE"]
+if os.environ.get("RATE_LIMIT_DEFAULT"):
+    app.config['RATE_LIMIT_DEFAULT'] = os.environ["RATE_LIMIT_DEFAULT"]
+if os.environ.get("SHED_MAX_IN_FLIGHT"):
+    app.config['SHED_MAX_IN_FLIGHT'] = int(os.environ["SHED_MAX_IN_FLIGHT"])
+if os.environ.get("JOB_WORKER_IN_PROCESS"):
+    app.config['JOB_WORKER_IN_PROCESS'] = env_flag("JOB_WORKER_IN_PROCESS")
+if os.environ.get("ORDER_STREAM_MAX_CONNECTIONS"):
+    app.config['ORDER_STREAM_MAX_CONNECTIONS'] = int(os.environ["ORDER_STREAM_MAX_CONNECTIONS"])
+if os.environ.get("SLOW_QUERY_MS"):
+    app.config['SLOW_QUERY_MS'] = float(os.environ["SLOW_QUERY_MS"])
+
+configure_engines(app)
+configure_json(app)
+accounts.init_app(app)
 
 db.init_app(app)
 migrate = Migrate(app, db)
-jwt = JWTManager(app)
+jwt = RequestJWTManager(app)
+request_metrics.init_app(app)
+product_search.init_app(app)
+revocation_cache.init_app(app)
+response_cache.init_app(app, generation=catalog_version)
+job_queue.init_app(app)
+batch_dispatcher.init_app(app)
+order_events.init_app(app)
+rate_limiter.init_app(app)
+
+# per-endpoint overrides, merged into the defaults init_app set
+if os.environ.get("RATE_LIMITS"):
+    app.config['RATE_LIMITS'] = dict(app.config['RATE_LIMITS'], **env_mapping("RATE_LIMITS"))
+if os.environ.get("SHED_CONCURRENCY"):
+    app.config['SHED_CONCURRENCY'] = dict(app.config['SHED_CONCURRENCY'], **env_mapping("SHED_CONCURRENCY", int))
 
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor', 'ETag', 'X-Query-Count', 'Server-Timing', 'Retry-After'])
 
 
 @app.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
-    username = data.get('username')
-    email = data.get('email')
-    password = data.get('password')
-    user_type = data.get('user_type') 
-
-    if user_type == 'buyer':
-        if Buyer.query.filter_by(email=email).first():
-            return make_response({"message": "Buyer with this email already exists!"}, 400)
-
-        new_buyer = Buyer(username=username, email=email)
-        new_buyer.password = password
-        db.session.add(new_buyer)
-        db.session.commit()
+    user_type = data.get('user_type')
 
-        return make_response({"message": "Buyer registered successfully!"}, 201)
-
-    elif user_type == 'vendor':
-        if Vendor.query.filter_by(email=email).first():
-            return make_response({"message": "Vendor with this email already exists!"}, 400)
-
-        new_vendor = Vendor(username=username, email=email)
-        new_vendor.password = password
-        db.session.add(new_vendor)
-        db.session.commit()
+    try:
+        accounts.register(data.get('username'), data.get('email'), data.get('password'), user_type)
+    except AccountError as e:
+        return make_response({"message": str(e)}, 400)
+    db.session.commit()
 
-        return make_response({"message": "Vendor registered successfully!"}, 201)
-        
-    elif user_type == 'both':
-        if Buyer.query.filter_by(email=email).first() or Vendor.query.filter_by(email=email).first():
-            return make_response({"message": "User with this email already exists!"}, 400)
-
-        new_buyer = Buyer(username=username, email=email)
-        new_buyer.password = password
-        new_vendor = Vendor(username=username, email=email)
-        new_vendor.password = password
-        db.session.add(new_buyer)
-        db.session.add(new_vendor)
-        db.session.commit()
+    if user_type == 'both':
         return make_response({"message": "Buyer and Vendor registered successfully!"}, 201)
-
-    return make_response({"message": "Invalid user_type!"}, 400)
+    return make_response({"message": f"{user_type.capitalize()} registered successfully!"}, 201)
 
 
 
 @app.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
-    email = data.get('email')
-    password = data.get('password')
-
-    # buyer
-    buyer = Buyer.query.filter_by(email=email).first()
-    if buyer and buyer.check_password(password):
-        access_token = create_access_token(identity={"id": buyer.id, "user_type": "buyer"})
-        refresh_token = create_refresh_token(identity={"id": buyer.id, "user_type": "buyer"})
-        return make_response({"access_token": access_token, "refresh_token": refresh_token}, 200)
-
-    # vendor 
-    vendor = Vendor.query.filter_by(email=email).first()
-    if vendor and vendor.check_password(password):
-        access_token = create_access_token(identity={"id": vendor.id, "user_type": "vendor"})
-        refresh_token = create_refresh_token(identity={"id": vendor.id, "user_type": "vendor"})
-        return make_response({"access_token": access_token, "refresh_token": refresh_token}, 200)
-
-    # user with both roles
-    general_user = Buyer.query.filter_by(email=email).first()
-    if general_user and general_user.check_password(password):
-        access_token = create_access_token(identity={"id": general_user.id, "user_type": "both"})
-        refresh_token = create_refresh_token(identity={"id": general_user.id, "user_type": "both"})
-        return make_response({"access_token": access_token, "refresh_token": refresh_token}, 200)
-
-
-    return make_response({"message": "Invalid username or password!"}, 400)
+
+    user, user_type = accounts.authenticate(data.get('email'), data.get('password'))
+    if user is None:
+        return make_response({"message": "Invalid username or password!"}, 400)
+
+    identity = accounts.identity_for(user, user_type)
+    access_token = create_access_token(identity=identity)
+    refresh_token = create_refresh_token(identity=identity)
+    return make_response({"access_token": access_token, "refresh_token": refresh_token}, 200)
     
 
 
@@ -106,26 +133,82 @@ def login():
 @app.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
-    jti = get_jwt()['jti'] 
-    revoked_token = TokenBlocklist(jti=jti)
-    db.session.add(revoked_token)
+    token = get_jwt()
+    revocation_cache.revoke(token['jti'], token.get('exp'))
     db.session.commit()
+    # expired rows are cleared out at most once per JWT_BLOCKLIST_PRUNE_INTERVAL
+    revocation_cache.prune_if_due()
     return make_response({"message": "Successfully logged out!"}, 200)
     
     
 
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
-    jti = jwt_payload['jti']
-    token = TokenBlocklist.query.filter_by(jti=jti).first()
-    return token is not None 
+    return revocation_cache.is_revoked(jwt_payload['jti'], jwt_payload.get('exp'))
+
+
+@jwt.token_verification_loader
+def check_token_scope(jwt_header, jwt_payload):
+    # a scoped token (an order stream ticket) opens its own endpoint only
+    scope = jwt_payload.get('scope')
+    return scope is None or scope == request.endpoint
+
+PRODUCT_SORT_COLUMNS = {'id': Product.id, 'price': Product.price, 'name': Product.name, 'rating': Product.rating_avg}
+
 
 @app.route('/products', methods=['GET', 'POST'])
 @jwt_required()
+@replica_reads
 def products():
     if request.method == "GET":
-        products = Product.query.all()
-        return make_response(jsonify([product.to_dict() for product in products]), 200)
+        stream = wants_stream()
+        if not stream:
+            cached = response_cache.get()
+            if cached:
+                return cached
+
+        sort_columns = PRODUCT_SORT_COLUMNS
+        try:
+            sort_key, descending = parse_sort(request.args.get('sort'), sort_columns)
+            limit = parse_limit(request.args.get('limit'))
+            min_price = parse_number(request.args.get('min_price'), 'min_price')
+            max_price = parse_number(request.args.get('max_price'), 'max_price')
+            min_rating = parse_number(request.args.get('min_rating'), 'min_rating')
+            fields = product_serializer.parse(request.args.get('fields'))
+
+            # ?fields= narrows the SELECT as well as the output
+            query = Product.query.options(*product_serializer.options(fields, sort_columns[sort_key]))
+            category = request.args.get('category')
+            if category:
+                query = query.filter(Product.category == category)
+            if min_price is not None:
+                query = query.filter(Product.price >= min_price)
+            if max_price is not None:
+                query = query.filter(Product.price <= max_price)
+            if min_rating is not None:
+                query = query.filter(Product.rating_avg >= min_rating)
+
+            # exports stream every matching product instead of a single page
+            if stream:
+                order = (sort_columns[sort_key].desc(), Product.id.desc()) if descending else (sort_columns[sort_key], Product.id)
+                return stream_response(query.order_by(*order), product_serializer.compile(fields))
+
+            products, next_cursor = keyset_page(
+                query, sort_key, sort_columns[sort_key], Product.id,
+                descending=descending, cursor=request.args.get('cursor'), limit=limit
+            )
+        except (PaginationError, FieldError) as e:
+            return make_response({"message": str(e)}, 400)
+
+        serialize = product_serializer.compile(fields)
+        response = make_response(jsonify([serialize(product) for product in products]), 200)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        tags = ['products'] + [f'product:{product.id}' for product in products]
+        # pages ordered or filtered by rating also change when a review does
+        if sort_key == 'rating' or min_rating is not None:
+            tags.append('products:rating')
+        return response_cache.set(response, tags=tags)
 
     
     elif request.method == "POST":
@@ -137,46 +220,185 @@ def products():
 
         new_product = Product(name=name, price=price, category=category, image_url=image_url)
         db.session.add(new_product)
+        db.session.flush()
+        product_search.upsert(new_product)
         db.session.commit()
+        # a new product can land on any listing page
+        response_cache.invalidate('products')
 
         return make_response({"message": "Product created successfully!"}, 201)
 
 
+@app.route('/products/bulk', methods=['POST'])
+@jwt_required()
+def bulk_products():
+    content_type = request.mimetype
+    if content_type not in ('application/x-ndjson', 'application/jsonl', 'text/csv', 'application/csv'):
+        return make_response({"message": "Send products as application/x-ndjson or text/csv!"}, 415)
+
+    batch_size = request.args.get('batch_size', app.config['BULK_IMPORT_BATCH_SIZE'], type=int)
+    batch_size = max(1, min(batch_size, 5000))
+
+    vendor_id = vendor_id_of(get_jwt()['sub'])
+
+    # rows are read from the request stream as they arrive, never buffered whole
+    try:
+        report = import_products(iter_rows(request.stream, content_type), batch_size, vendor_id)
+    except (UnicodeDecodeError, csv.Error):
+        db.session.rollback()
+        return make_response({"message": "Upload is not valid UTF-8 NDJSON/CSV!"}, 400)
+    finally:
+        response_cache.invalidate('products')
+
+    return make_response(report, 200)
+
+
+@app.route('/products/search', methods=['GET'])
+@jwt_required()
+@replica_reads
+def search_products():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return make_response({"message": "Search query 'q' is required!"}, 400)
+
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        fields = product_serializer.parse(request.args.get('fields'))
+        cursor = request.args.get('cursor')
+        position = decode_cursor(cursor) if cursor else {'offset': 0}
+        offset = position.get('offset') if isinstance(position, dict) else None
+        if not is_int64(offset) or offset < 0:
+            raise PaginationError("Invalid cursor!")
+    except (PaginationError, FieldError) as e:
+        return make_response({"message": str(e)}, 400)
+
+    # ask for one extra hit to know whether there is a next page
+    product_ids = product_search.search(query, limit + 1, offset)
+    has_more = len(product_ids) > limit
+    product_ids = product_ids[:limit]
+
+    query = Product.query.options(*product_serializer.options(fields)).filter(Product.id.in_(product_ids))
+    products_by_id = {product.id: product for product in query}
+    serialize = product_serializer.compile(fields)
+    results = [serialize(products_by_id[product_id]) for product_id in product_ids if product_id in products_by_id]
+
+    response = make_response(jsonify(results), 200)
+    if has_more:
+        response.headers['X-Next-Cursor'] = encode_cursor({'offset': offset + limit})
+    return response
+
+
+@app.route('/products/changes', methods=['GET'])
+@jwt_required()
+@replica_reads
+def product_changes():
+    # incremental sync: pass back the returned cursor as ?since= next time
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        fields = product_serializer.parse(request.args.get('fields'))
+        since = parse_since(request.args.get('since'))
+    except CursorExpiredError as e:
+        return make_response({"message": str(e)}, 410)
+    except (PaginationError, FieldError) as e:
+        return make_response({"message": str(e)}, 400)
+
+    changes, cursor, has_more = catalog_changes(since, limit, fields)
+    return make_response({"changes": changes, "cursor": cursor, "has_more": has_more}, 200)
+
+
 @app.route('/products/<int:product_id>', methods=['GET', 'PATCH', 'DELETE'])
 @jwt_required()
+@replica_reads
 def single_product(product_id):
-    product = Product.query.get_or_404(product_id)
-    
     if request.method == "GET":
-        return make_response(product.to_dict(), 200)
+        cached = response_cache.get()
+        if cached:
+            return cached
+
+        try:
+            fields = product_serializer.parse(request.args.get('fields'))
+        except FieldError as e:
+            return make_response({"message": str(e)}, 400)
+        product = Product.query.options(*product_serializer.options(fields)).get_or_404(product_id)
+        return response_cache.set(make_response(product.to_dict(fields), 200), tags=[f'product:{product.id}'])
 
+    product = Product.query.get_or_404(product_id)
     
-    elif request.method == "PATCH":
+    if request.method == "PATCH":
         data = request.get_json()
+        # changing a filter/sort field can move the product between listing pages
+        relisted = any(key in data and data[key] != getattr(product, key) for key in ('name', 'price', 'category'))
 
         product.name = data.get('name', product.name)
         product.price = data.get('price', product.price)
         product.category = data.get('category', product.category)
         product.image_url = data.get('image_url', product.image_url)
         
+        product_search.upsert(product)
         db.session.commit()
+        response_cache.invalidate(f'product:{product_id}', *(['products'] if relisted else []))
         return make_response({"message": "Product updated successfully!"}, 200)
     
 
     elif request.method == "DELETE":
         product = Product.query.get_or_404(product_id)
         db.session.delete(product)
+        record_deletion(product_id)
+        product_search.remove(product_id)
         db.session.commit()
+        # keyset pages that did not contain the product are unaffected
+        response_cache.invalidate(f'product:{product_id}')
         return make_response({"message": "Product deleted successfully!"}, 200)
     
 
+@app.route('/products/<int:product_id>/inventory', methods=['GET', 'PATCH'])
+@jwt_required()
+def product_inventory(product_id):
+    product = Product.query.get_or_404(product_id)
+
+    if request.method == "GET":
+        return make_response(stock_levels(product), 200)
+
+    elif request.method == "PATCH":
+        vendor_id = vendor_id_of(get_jwt()['sub'])
+        if vendor_id is None:
+            return make_response({"message": "Only vendors can manage inventory!"}, 403)
+
+        sellers = {vendor_id for (vendor_id,) in db.session.query(vendor_products.c.vendor_id).filter(
+            vendor_products.c.product_id == product_id
+        )}
+        if vendor_id not in sellers:
+            return make_response({"message": "You do not sell this product!"}, 403)
+
+        # {"stock": 100, "shards": 8} sets the level, {"adjust": -5} changes it,
+        # {"vendor_stock": 40} sets the caller's own stock of the product
+        data = request.get_json()
+        try:
+            if 'stock' in data or 'shards' in data:
+                # re-sharding alone keeps the current level
+                stock = data['stock'] if 'stock' in data else stock_levels(product)['stock']
+                set_stock(product, stock, data.get('shards'))
+            if 'adjust' in data:
+                adjust_stock(product, data['adjust'])
+            if 'vendor_stock' in data:
+                set_vendor_stock(vendor_id, product_id, data['vendor_stock'])
+        except InventoryError as e:
+            db.session.rollback()
+            return make_response({"message": str(e)}, 400)
+
+        db.session.commit()
+        return make_response(stock_levels(product), 200)
+
+
 @app.route('/cart', methods=['GET', 'POST', "PATCH", "DELETE"])
 @jwt_required()
 def cart():
-    user_id = get_jwt()['sub']['id']
+    user_id = buyer_id_of(get_jwt()['sub'])
+    if user_id is None:
+        return make_response({"message": "Only buyers have a cart!"}, 403)
     
     if request.method == "GET":
-        cart = Cart.query.filter_by(buyer_id=user_id).first()
+        cart = Cart.query.options(*load_profile('cart')).filter_by(buyer_id=user_id).first()
         if cart:
             return make_response(cart.to_dict(), 200)
         return make_response({"message": "Cart not found!"}, 404)
@@ -194,18 +416,15 @@ def cart():
             return make_response({"message": "Cart not found!"}, 404)
 
         data = request.get_json()
-        product_ids = data.get('product_ids', [])
-
-        
-        cart.products.clear()  
-                
-        
-        for product_id in product_ids:
-            product = Product.query.get(product_id)
-            if product:
-                cart.products.append(product)
+        try:
+            missing = apply_cart_changes(cart.id, data)
+        except CartUpdateError as e:
+            db.session.rollback()
+            return make_response({"message": str(e)}, 400)
 
         db.session.commit()
+        if missing:
+            return make_response({"message": "Cart updated successfully!", "missing_product_ids": missing}, 200)
         return make_response({"message": "Cart updated successfully!"}, 200)
 
     
@@ -221,11 +440,22 @@ def cart():
 @app.route('/orders', methods=['GET', 'POST'])
 @jwt_required()
 def orders():
-    user_id = get_jwt()['sub']['id']
+    user_id = buyer_id_of(get_jwt()['sub'])
+    if user_id is None:
+        return make_response({"message": "Only buyers have orders here!"}, 403)
 
     if request.method == "GET":
-        orders = Order.query.filter_by(buyer_id=user_id).all()
-        return make_response([order.to_dict() for order in orders], 200)
+        try:
+            fields = order_serializer.parse(request.args.get('fields'))
+        except FieldError as e:
+            return make_response({"message": str(e)}, 400)
+
+        query = Order.query.options(*order_serializer.options(fields)).filter_by(buyer_id=user_id)
+        serialize = order_serializer.compile(fields)
+        if wants_stream():
+            return stream_response(query.order_by(Order.id), serialize)
+
+        return make_response([serialize(order) for order in query], 200)
 
     elif request.method == "POST":
         data = request.get_json()
@@ -234,18 +464,104 @@ def orders():
 
         new_order = Order(buyer_id=user_id, vendor_id=vendor_id, total_price=total_price)
         db.session.add(new_order)
+        db.session.flush()
+        record_order(new_order)
+        # processing happens in the job worker, committed with the order
+        order_placed(new_order)
         db.session.commit()
         return make_response({"message": "Order created successfully!", "order": new_order.to_dict()}, 201)
     
-@app.route('/orders/<int:order_id>', methods=['DELETE'])
+@app.route('/orders/stream', methods=['GET'])
+# EventSource cannot set headers, so a ticket may also come as ?jwt=
+@jwt_required(locations=['headers', 'query_string'])
+def order_stream():
+    # Server-sent events for the buyer's orders and the vendor's sales,
+    # instead of polling GET /orders: a snapshot first (skip it with
+    # ?snapshot=0), then order.created / order.status_changed / order.deleted
+    if get_jwt_request_location() == 'query_string' and get_jwt().get('scope') != TICKET_SCOPE:
+        # a full access token in the URL would end up in access logs
+        return make_response({"message": "Pass a ticket from POST /orders/stream/ticket as ?jwt=, not an access token!"}, 401)
+    identity = get_jwt()['sub']
+    buyer_id = buyer_id_of(identity)
+    vendor_id = vendor_id_of(identity)
+    if buyer_id is None and vendor_id is None:
+        return make_response({"message": "No orders to follow!"}, 403)
+
+    snapshot = request.args.get('snapshot', '1').lower() not in ('0', 'false', 'no')
+    return order_events.stream(buyer_id, vendor_id, snapshot=snapshot)
+
+
+@app.route('/orders/stream/ticket', methods=['POST'])
+@jwt_required()
+def order_stream_ticket():
+    # a short-lived token for EventSource clients, which cannot send headers
+    return make_response({
+        "ticket": order_events.ticket(get_jwt()['sub']),
+        "expires_in": app.config['ORDER_STREAM_TICKET_SECONDS'],
+    }, 201)
+
+
+@app.route('/checkout', methods=['POST'])
+@jwt_required()
+def checkout():
+    user_id = buyer_id_of(get_jwt()['sub'])
+    if user_id is None:
+        return make_response({"message": "Only buyers can check out!"}, 403)
+
+    cart = Cart.query.filter_by(buyer_id=user_id).first()
+    if not cart:
+        return make_response({"message": "Cart not found!"}, 404)
+
+    try:
+        orders = checkout_cart(cart)
+    except OutOfStockError as e:
+        db.session.rollback()
+        return make_response({"message": str(e), "out_of_stock": e.product_ids}, 409)
+    except CheckoutError as e:
+        db.session.rollback()
+        return make_response({"message": str(e)}, 409)
+
+    # serialize before the commit expires the new rows
+    created = [order.to_dict() for order in orders]
+    db.session.commit()
+    return make_response({"message": "Checkout completed successfully!", "orders": created}, 201)
+
+@app.route('/orders/<int:order_id>', methods=['PATCH', 'DELETE'])
 @jwt_required()
 def order(order_id):
-    user_id = get_jwt()['sub']['id']
+    identity = get_jwt()['sub']
+    buyer_id = buyer_id_of(identity)
+    vendor_id = vendor_id_of(identity)
+
+    if request.method == "PATCH":
+        status = (request.get_json() or {}).get('status')
+        if status not in TRANSITIONS:
+            return make_response({"message": f"status must be one of {', '.join(TRANSITIONS)}!"}, 400)
+
+        order = db.session.get(Order, order_id)
+        is_vendor = order is not None and vendor_id is not None and order.vendor_id == vendor_id
+        is_buyer = order is not None and buyer_id is not None and order.buyer_id == buyer_id
+        if not (is_vendor or is_buyer):
+            return make_response({"message": "Order not found!"}, 404)
+        # the vendor fulfils the order; the buyer can only cancel it
+        if not is_vendor and status != 'Cancelled':
+            return make_response({"message": "Buyers can only cancel orders!"}, 403)
+
+        try:
+            change_status(order, status)
+        except OrderStatusError as e:
+            db.session.rollback()
+            return make_response({"message": str(e)}, 409)
 
-    order = Order.query.filter_by(id=order_id, buyer_id=user_id).first()
+        db.session.commit()
+        return make_response({"message": "Order updated successfully!", "order": order.to_dict()}, 200)
+
+    order = Order.query.filter_by(id=order_id, buyer_id=buyer_id).first() if buyer_id is not None else None
     if not order:
         return make_response({"message": "Order not found!"}, 404)
 
+    forget_order(order)
+    order_deleted(order)
     db.session.delete(order)
     db.session.commit()
     return make_response({"message": "Order deleted successfully!"}, 200)
@@ -253,28 +569,67 @@ def order(order_id):
 
 
 
-@app.route('/products/<int:product_id>/reviews', methods=['POST', "DELETE"])
+@app.route('/products/<int:product_id>/reviews', methods=['GET', 'POST', 'PATCH', "DELETE"])
 @jwt_required()
+@replica_reads
 def review(product_id):
+    if request.method == "GET":
+        # anyone can read reviews, newest first; ?sort=rating or -rating
+        sort_columns = {'id': Review.id, 'rating': Review.rating}
+        try:
+            sort_key, descending = parse_sort(request.args.get('sort'), sort_columns, default='-id')
+            limit = parse_limit(request.args.get('limit'))
+            fields = review_serializer.parse(request.args.get('fields'))
+
+            Product.query.options(load_only(Product.id)).get_or_404(product_id)
+            # the reviewers come in the same SELECT as the reviews
+            query = (
+                Review.query
+                .options(*review_serializer.options(fields, sort_columns[sort_key]), *load_profile('review'))
+                .filter(Review.product_id == product_id)
+            )
+            reviews, next_cursor = keyset_page(
+                query, sort_key, sort_columns[sort_key], Review.id,
+                descending=descending, cursor=request.args.get('cursor'), limit=limit
+            )
+        except (PaginationError, FieldError) as e:
+            return make_response({"message": str(e)}, 400)
+
+        serialize = review_serializer.compile(fields)
+        response = make_response(jsonify([serialize(review) for review in reviews]), 200)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
+    user_id = buyer_id_of(get_jwt()['sub'])
+    if user_id is None:
+        return make_response({"message": "Vendors cannot leave reviews!"}, 403)
+
     if request.method == "POST":
         data = request.get_json()
-        rating = data.get('rating')
         comment = data.get('comment')
 
-        user_id = get_jwt()['sub']['id']
-        vendor = Vendor.query.filter_by(id=user_id).first()
+        try:
+            rating = validate_rating(data.get('rating'))
+        except RatingError as e:
+            return make_response({"message": str(e)}, 400)
 
-        if vendor:
-            return make_response({"message": "Vendors cannot leave reviews!"}, 403)
+        Product.query.get_or_404(product_id)
+        # the review is about the vendor selling the product
+        vendor_id = db.session.query(db.func.min(vendor_products.c.vendor_id)).filter(
+            vendor_products.c.product_id == product_id
+        ).scalar()
 
-        new_review = Review(rating=rating, comment=comment, product_id=product_id, buyer_id=user_id)
+        new_review = Review(rating=rating, comment=comment, product_id=product_id, vendor_id=vendor_id, buyer_id=user_id)
         db.session.add(new_review)
+        apply_rating_change(product_id, added=rating)
         db.session.commit()
+        response_cache.invalidate(f'product:{product_id}', 'products:rating')
         return make_response({"message": "Review created successfully!"}, 201)
     
     elif request.method == 'PATCH':
         review_id = request.args.get('review_id')
-        review = Review.query.filter_by(id=review_id, buyer_id=user_id).first()
+        review = Review.query.filter_by(id=review_id, product_id=product_id, buyer_id=user_id).first()
 
         if not review:
             return make_response({"message": "Review not found or not authorized to update!"}, 404)
@@ -284,27 +639,129 @@ def review(product_id):
         comment = data.get('comment')
 
         if rating is not None:
+            try:
+                rating = validate_rating(rating)
+            except RatingError as e:
+                return make_response({"message": str(e)}, 400)
+            if rating != review.rating:
+                apply_rating_change(product_id, added=rating, removed=review.rating)
             review.rating = rating
         if comment is not None:
             review.comment = comment
 
         db.session.commit()
+        response_cache.invalidate(f'product:{product_id}', 'products:rating')
         return make_response({"message": "Review updated successfully!"}, 200)
 
 
     elif request.method == 'DELETE':
         review_id = request.args.get('review_id')
         
-        review = Review.query.filter_by(id=review_id, buyer_id=user_id).first()
+        review = Review.query.filter_by(id=review_id, product_id=product_id, buyer_id=user_id).first()
 
         if not review:
             return make_response({"message": "Review not found or not authorized to delete!"}, 404)
 
+        apply_rating_change(product_id, removed=review.rating)
         db.session.delete(review)
         db.session.commit()
+        response_cache.invalidate(f'product:{product_id}', 'products:rating')
         return make_response({"message": "Review deleted successfully!"}, 200)
 
 
+@app.route('/vendors/<int:vendor_id>/products', methods=['GET'])
+@jwt_required()
+@replica_reads
+def vendor_products_listing(vendor_id):
+    # The vendor's catalog, paged and sorted like /products. Every product
+    # lists all the vendors selling it, loaded for the whole page at once.
+    try:
+        sort_key, descending = parse_sort(request.args.get('sort'), PRODUCT_SORT_COLUMNS)
+        limit = parse_limit(request.args.get('limit'))
+        fields = product_serializer.parse(request.args.get('fields'))
+
+        Vendor.query.options(load_only(Vendor.id)).get_or_404(vendor_id)
+        query = (
+            Product.query
+            .options(*product_serializer.options(fields, PRODUCT_SORT_COLUMNS[sort_key]), *load_profile('product_vendors'))
+            .join(vendor_products, vendor_products.c.product_id == Product.id)
+            .filter(vendor_products.c.vendor_id == vendor_id)
+        )
+        products, next_cursor = keyset_page(
+            query, sort_key, PRODUCT_SORT_COLUMNS[sort_key], Product.id,
+            descending=descending, cursor=request.args.get('cursor'), limit=limit
+        )
+    except (PaginationError, FieldError) as e:
+        return make_response({"message": str(e)}, 400)
+
+    serialize = product_serializer.compile(fields)
+    response = make_response(jsonify([
+        dict(serialize(product), vendors=[{'id': vendor.id, 'username': vendor.username} for vendor in product.vendors])
+        for product in products
+    ]), 200)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+@app.route('/vendors/<int:vendor_id>/analytics', methods=['GET'])
+@jwt_required()
+@replica_reads
+def vendor_sales_analytics(vendor_id):
+    if vendor_id_of(get_jwt()['sub']) != vendor_id:
+        return make_response({"message": "Not authorized to view these analytics!"}, 403)
+
+    period = request.args.get('period', 'day')
+    if period not in PERIODS:
+        return make_response({"message": f"period must be one of {', '.join(PERIODS)}!"}, 400)
+
+    try:
+        start = request.args.get('start')
+        start = datetime.fromisoformat(start) if start else None
+        end = request.args.get('end')
+        end = datetime.fromisoformat(end) if end else None
+    except ValueError:
+        return make_response({"message": "start and end must be ISO dates (YYYY-MM-DD)!"}, 400)
+
+    buckets = vendor_analytics(vendor_id, period, start, end)
+    return make_response({"vendor_id": vendor_id, "period": period, "buckets": buckets}, 200)
+
+
+@app.route('/batch', methods=['POST'])
+@jwt_required()
+def batch():
+    # {"requests": [{"method": "GET", "path": "/products/1"}, ...]} in one
+    # round trip, authenticated once; see batch.py
+    try:
+        items = batch_dispatcher.parse(request.get_json(silent=True))
+    except BatchError as e:
+        return make_response({"message": str(e)}, 400)
+
+    return make_response({"responses": batch_dispatcher.run(items)}, 200)
+
+
+@app.cli.command('rebuild-analytics')
+def rebuild_analytics_command():
+    buckets = rebuild_rollups()
+    db.session.commit()
+    print(f"Vendor sales rollups rebuilt ({buckets} buckets).")
+
+
+@app.cli.command('prune-tombstones')
+@click.option('--days', type=int, default=30, help="Keep tombstones this many days.")
+def prune_tombstones_command(days):
+    deleted = prune_tombstones(days)
+    db.session.commit()
+    print(f"Pruned {deleted} product tombstones.")
+
+
+@app.cli.command('rebuild-ratings')
+def rebuild_ratings_command():
+    rebuild_ratings()
+    db.session.commit()
+    print("Product rating summaries rebuilt.")
+
+
 
 
 #Home route or root page
@@ -313,5 +770,25 @@ def home():
     return make_response({"message" : "Welcome To this API generation"})
 
 
+def warm_up(caches=True, connections=True):
+    # Primes per-process state so the first requests after a deploy do not
+    # pay for it. Called from the gunicorn hooks in gunicorn.conf.py.
+    with app.app_context():
+        if caches:
+            revocation_cache.warm()
+            response_cache.clear()
+            # picks FTS5 or the in-memory index; the latter is built here
+            product_search.search('warmup', 1)
+
+        if connections:
+            engine = db.engine
+            size = engine.pool.size() if hasattr(engine.pool, 'size') else 1
+            opened = [engine.connect() for _ in range(size)]
+            for connection in opened:
+                connection.close()
+
+        db.session.remove()
+
+
 if __name__ == "__main__":
     app.run(port=8083, debug=True)
\ No newline at end of file
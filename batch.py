@@ -0,0 +1,160 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, request
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+
+from models import db
+from rate_limit import rate_limiter
+
+
+METHODS = ('GET', 'POST', 'PATCH', 'DELETE')
+
+# what verify_jwt_in_request() leaves on g for get_jwt() and friends
+JWT_CONTEXT = ('_jwt_extended_jwt', '_jwt_extended_jwt_header', '_jwt_extended_jwt_user', '_jwt_extended_jwt_location')
+
+# endpoints whose response never ends, so it cannot go into a batch body
+STREAMING_ENDPOINTS = ('order_stream',)
+
+# response headers passed back to the client for each sub-request
+FORWARDED_HEADERS = ('ETag', 'X-Next-Cursor', 'Retry-After')
+
+
+class BatchError(ValueError):
+    pass
+
+
+class BatchDispatcher:
+    # Runs the sub-requests of one POST /batch through the app's own view
+    # functions. The batch request is authenticated once; every sub-request
+    # reuses that JWT context instead of decoding the token and checking
+    # the blocklist again.
+    #
+    # Each sub-request is charged to the batch caller's rate limit bucket
+    # for its own endpoint and takes that endpoint's shed slot, exactly as
+    # if it had been sent on its own; otherwise a batch of twenty logins
+    # would be twenty password guesses for the price of one request.
+    #
+    # Sub-requests run in order. A run of consecutive GETs is independent by
+    # definition and runs concurrently, each in its own app context (and so
+    # its own database session); any other method waits for what came
+    # before it, so a client can still read its own writes.
+
+    def __init__(self, app=None):
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BATCH_MAX_REQUESTS', 20)
+        app.config.setdefault('BATCH_MAX_WORKERS', 4)
+        self.app = app
+        app.extensions['batch_dispatcher'] = self
+
+    def parse(self, data):
+        items = data.get('requests') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            raise BatchError("Send {\"requests\": [{\"method\", \"path\", \"body\"}, ...]}!")
+        if len(items) > self.app.config['BATCH_MAX_REQUESTS']:
+            raise BatchError(f"A batch can hold at most {self.app.config['BATCH_MAX_REQUESTS']} requests!")
+
+        parsed = []
+        for item in items:
+            if not isinstance(item, dict):
+                raise BatchError("Each request must be an object!")
+            method = str(item.get('method', 'GET')).upper()
+            path = item.get('path')
+            headers = item.get('headers') or {}
+            if method not in METHODS:
+                raise BatchError(f"method must be one of {', '.join(METHODS)}!")
+            if not isinstance(path, str) or not path.startswith('/'):
+                raise BatchError("path must be an absolute path like /products/1!")
+            if not isinstance(headers, dict):
+                raise BatchError("headers must be an object!")
+            parsed.append((method, path, item.get('body'), headers))
+        return parsed
+
+    def _pool(self):
+        # created on first use, so each gunicorn worker gets its own threads
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.app.config['BATCH_MAX_WORKERS'], thread_name_prefix='batch'
+            )
+        return self.executor
+
+    def _dispatch(self, item, base_url, remote_addr, caller):
+        method, path, body, headers = item
+        builder = EnvironBuilder(
+            path=path, method=method, json=body, headers=headers, base_url=base_url,
+            environ_overrides={'REMOTE_ADDR': remote_addr},
+        )
+        with self.app.request_context(builder.get_environ()):
+            try:
+                if request.routing_exception is not None:
+                    raise request.routing_exception
+                if request.url_rule.endpoint == 'batch':
+                    raise BatchError("Batches cannot be nested!")
+                if request.url_rule.endpoint in STREAMING_ENDPOINTS:
+                    raise BatchError("Event streams cannot be batched!")
+                # released by the limiter's teardown when this context pops
+                response = rate_limiter.check(request.url_rule.endpoint, caller, count_in_flight=False)
+                if response is None:
+                    view = self.app.view_functions[request.url_rule.endpoint]
+                    # skip jwt_required(); the batch request was already verified
+                    view = getattr(view, '__wrapped__', view)
+                    response = self.app.make_response(view(**request.view_args))
+            except HTTPException as e:
+                # JSON instead of werkzeug's HTML error page, to fit the batch body
+                response = self.app.make_response(({"message": e.description}, e.code))
+            except BatchError as e:
+                response = self.app.make_response(({"message": str(e)}, 400))
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception("batch sub-request %s %s failed", method, path)
+                response = self.app.make_response(({"message": "Internal server error!"}, 500))
+            finally:
+                g.pop('read_replica', None)
+
+            # read the body while the request context (and any stream) is open
+            result = {
+                'status': response.status_code,
+                'headers': {name: response.headers[name] for name in FORWARDED_HEADERS if name in response.headers},
+                'body': response.get_json(silent=True) if response.is_json else response.get_data(as_text=True),
+            }
+            response.close()
+            return result
+
+    def _dispatch_concurrently(self, item, jwt_context, base_url, remote_addr, caller):
+        with self.app.app_context():
+            for name, value in jwt_context.items():
+                setattr(g, name, value)
+            return self._dispatch(item, base_url, remote_addr, caller)
+
+    def run(self, items):
+        jwt_context = {name: g.get(name) for name in JWT_CONTEXT}
+        base_url = request.host_url
+        remote_addr = request.remote_addr
+        caller = rate_limiter.caller()
+
+        results = []
+        index = 0
+        while index < len(items):
+            reads = []
+            while index + len(reads) < len(items) and items[index + len(reads)][0] == 'GET':
+                reads.append(items[index + len(reads)])
+
+            if len(reads) > 1:
+                futures = [
+                    self._pool().submit(self._dispatch_concurrently, item, jwt_context, base_url, remote_addr, caller)
+                    for item in reads
+                ]
+                results.extend(future.result() for future in futures)
+                index += len(reads)
+            else:
+                # a lone read or a write runs in the batch request's own context
+                results.append(self._dispatch(items[index], base_url, remote_addr, caller))
+                index += 1
+        return results
+
+
+batch_dispatcher = BatchDispatcher()
@@ -0,0 +1,311 @@
+"""Mixed-traffic load test for the API.
+
+Boots app.py in-process on a threaded WSGI server against a throwaway
+database, seeds it, then drives it with concurrent clients that log in, browse
+and search the catalog, edit their cart, place orders and leave reviews.
+Prints throughput and p50/p95/p99 latency per endpoint and can write the same
+numbers as JSON for before/after comparisons:
+
+    python benchmarks/load_test.py --clients 16 --duration 30 --output bench.json
+    python benchmarks/load_test.py --database-url postgresql://localhost/safari_bench
+"""
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# relative weights of each client action
+SCENARIOS = {
+    'browse': 40,
+    'product': 20,
+    'search': 10,
+    'cart': 15,
+    'order': 10,
+    'review': 5,
+}
+
+CATEGORIES = ['Fruits', 'Vegetables', 'Grains', 'Dairy', 'Meat', 'Spices', 'Beverages', 'Snacks']
+PASSWORD = 'benchmark'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help="database to benchmark against (default: a temporary SQLite file)")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients")
+    parser.add_argument('--duration', type=float, default=20, help="seconds of traffic per run")
+    parser.add_argument('--products', type=int, default=2000, help="products to seed")
+    parser.add_argument('--seed', type=int, default=1, help="random seed for data and traffic")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    return parser.parse_args()
+
+
+def configure(args):
+    # app.py reads its configuration at import time
+    args.temporary_database = None
+    if not args.database_url:
+        handle, path = tempfile.mkstemp(prefix='safari-bench-', suffix='.db')
+        os.close(handle)
+        args.database_url = f'sqlite:///{path}'
+        args.temporary_database = path
+    os.environ['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-secret-key-benchmark-secret')
+    # a fresh in-process store, not the shared file that outlives the run
+    os.environ['RATE_LIMIT_STORAGE'] = 'memory'
+    sys.path.insert(0, ROOT)
+
+
+def seed(app, args):
+    from sqlalchemy import insert
+    from accounts import hash_password
+    from models import db, Buyer, Vendor, User, Cart, Product, vendor_products
+
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        password = hash_password(PASSWORD)
+        db.drop_all()
+        db.create_all()
+
+        db.session.execute(insert(Vendor.__table__), [
+            {'id': 1, 'username': 'bench_vendor', 'email': 'vendor@bench.local', 'password': password}
+        ])
+        db.session.execute(insert(Buyer.__table__), [
+            {'id': i, 'username': f'bench_buyer_{i}', 'email': f'buyer{i}@bench.local', 'password': password}
+            for i in range(1, args.clients + 1)
+        ])
+        db.session.execute(insert(User.__table__), [
+            {'username': f'bench_buyer_{i}', 'email': f'buyer{i}@bench.local', 'password': password, 'buyer_id': i}
+            for i in range(1, args.clients + 1)
+        ])
+        db.session.execute(insert(Cart.__table__), [{'buyer_id': i} for i in range(1, args.clients + 1)])
+        db.session.execute(insert(Product.__table__), [
+            {
+                'id': i,
+                'name': f'{rng.choice(["Fresh", "Organic", "Local", "Dried"])} {rng.choice(CATEGORIES).lower()} {i}',
+                'category': rng.choice(CATEGORIES),
+                'price': round(rng.uniform(0.5, 200), 2),
+                'image_url': f'https://example.com/{i}.jpg',
+            }
+            for i in range(1, args.products + 1)
+        ])
+        db.session.execute(insert(vendor_products), [
+            {'vendor_id': 1, 'product_id': i} for i in range(1, args.products + 1)
+        ])
+        db.session.commit()
+
+        from search import product_search
+        product_search.rebuild()
+        db.session.commit()
+
+
+def serve(app):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    # keep-alive, so connection setup is not part of every measurement
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Client:
+
+    def __init__(self, port, index, args, results):
+        self.port = port
+        self.index = index
+        self.args = args
+        self.results = results
+        self.rng = random.Random(args.seed * 1000 + index)
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        self.token = None
+
+    def request(self, label, method, path, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        payload = json.dumps(body) if body is not None else None
+
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            data, status = b'', 0
+        self.results.append((label, status, time.perf_counter() - started))
+        return status, data
+
+    def login(self):
+        status, data = self.request('POST /login', 'POST', '/login', {
+            'email': f'buyer{self.index}@bench.local', 'password': PASSWORD,
+        })
+        if status != 200:
+            # without a token every later request would be a 401
+            raise SystemExit(f"Client {self.index} could not log in ({status}): {data[:200]!r}")
+        self.token = json.loads(data)['access_token']
+
+    def product_id(self):
+        # a few products get most of the traffic
+        return min(int(self.rng.paretovariate(1.2)), self.args.products)
+
+    def browse(self):
+        query = f'/products?limit=20&sort={self.rng.choice(["id", "price", "-price", "name"])}'
+        if self.rng.random() < 0.5:
+            query += f'&category={self.rng.choice(CATEGORIES)}'
+        self.request('GET /products', 'GET', query)
+
+    def product(self):
+        self.request('GET /products/<id>', 'GET', f'/products/{self.product_id()}')
+
+    def search(self):
+        self.request('GET /products/search', 'GET', f'/products/search?q={self.rng.choice(CATEGORIES).lower()}')
+
+    def cart(self):
+        self.request('PATCH /cart', 'PATCH', '/cart', {'add': [{'product_id': self.product_id(), 'quantity': 1}]})
+
+    def order(self):
+        self.request('POST /orders', 'POST', '/orders', {'vendor_id': 1, 'total_price': round(self.rng.uniform(1, 500), 2)})
+
+    def review(self):
+        self.request('POST /products/<id>/reviews', 'POST', f'/products/{self.product_id()}/reviews', {
+            'rating': self.rng.randint(1, 5), 'comment': 'benchmark review',
+        })
+
+    def run(self, deadline):
+        actions = list(SCENARIOS)
+        weights = [SCENARIOS[action] for action in actions]
+        while time.monotonic() < deadline:
+            getattr(self, self.rng.choices(actions, weights)[0])()
+        self.connection.close()
+
+
+def percentile(ordered, fraction):
+    # nearest-rank percentile of an already sorted list
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(results, elapsed):
+    by_label = defaultdict(list)
+    errors = defaultdict(int)
+    for label, status, latency in results:
+        by_label[label].append(latency)
+        # anything but a 2xx: a 401 or 429 is as much a failed request as a 500
+        if not 200 <= status < 300:
+            errors[label] += 1
+
+    def stats(latencies, error_count):
+        ordered = sorted(latencies)
+        return {
+            'requests': len(ordered),
+            'errors': error_count,
+            'throughput_rps': round(len(ordered) / elapsed, 2),
+            'mean_ms': round(1000 * sum(ordered) / len(ordered), 3) if ordered else 0.0,
+            'p50_ms': round(1000 * percentile(ordered, 0.50), 3),
+            'p95_ms': round(1000 * percentile(ordered, 0.95), 3),
+            'p99_ms': round(1000 * percentile(ordered, 0.99), 3),
+        }
+
+    endpoints = {label: stats(latencies, errors[label]) for label, latencies in sorted(by_label.items())}
+    total = stats([latency for _, _, latency in results], sum(errors.values()))
+    return endpoints, total
+
+
+def report(endpoints, total, logins):
+    header = f"{'endpoint':<30} {'reqs':>7} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+
+    def row(label, stats):
+        print(f"{label:<30} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput_rps']:>9} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+
+    print(header)
+    print('-' * len(header))
+    for label, stats in list(endpoints.items()) + [('TOTAL', total)]:
+        row(label, stats)
+    # timed in their own window before the traffic, and not part of TOTAL
+    print('-' * len(header))
+    row('POST /login (before the run)', logins)
+
+
+def benchmark(args):
+    from app import app
+
+    # a handful of clients sending hundreds of requests a minute each is the
+    # point of the run; with limits on it would measure the 429s instead
+    app.config['RATE_LIMIT_ENABLED'] = False
+    seed(app, args)
+    server = serve(app)
+    try:
+        port = server.server_port
+        login_results = []
+        clients = [Client(port, index, args, login_results) for index in range(1, args.clients + 1)]
+        login_started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            for future in [pool.submit(client.login) for client in clients]:
+                future.result()
+        _, logins = summarize(login_results, time.monotonic() - login_started)
+
+        results = []
+        for client in clients:
+            client.results = results
+        started = time.monotonic()
+        deadline = started + args.duration
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            for future in [pool.submit(client.run, deadline) for client in clients]:
+                future.result()
+        elapsed = time.monotonic() - started
+    finally:
+        server.shutdown()
+
+    endpoints, total = summarize(results, elapsed)
+    report(endpoints, total, logins)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'config': {
+                    'database': args.database_url.split('://', 1)[0],
+                    'clients': args.clients,
+                    'duration_s': args.duration,
+                    'products': args.products,
+                    'seed': args.seed,
+                },
+                'elapsed_s': round(elapsed, 3),
+                'endpoints': endpoints,
+                'total': total,
+                'logins': logins,
+            }, output, indent=2)
+
+
+def main():
+    args = parse_args()
+    configure(args)
+    try:
+        benchmark(args)
+    finally:
+        if args.temporary_database:
+            # SQLite in WAL mode leaves the -wal and -shm files next to it
+            for path in (args.temporary_database, args.temporary_database + '-wal', args.temporary_database + '-shm'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
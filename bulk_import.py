@@ -0,0 +1,141 @@
+import csv
+import io
+import json
+import math
+from collections import namedtuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Product, advance_catalog_version, vendor_products
+from search import product_search
+
+
+MAX_REPORTED_ERRORS = 1000
+
+IndexedProduct = namedtuple('IndexedProduct', 'id name category')
+
+
+class RowError(ValueError):
+    pass
+
+
+def iter_rows(stream, content_type):
+    # yields (row number, dict or RowError) while reading the body line by line
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+    if content_type in ('text/csv', 'application/csv'):
+        reader = csv.DictReader(text)
+        for number, row in enumerate(reader, start=1):
+            yield number, row
+        return
+
+    for number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, RowError("Invalid JSON!")
+            continue
+        yield number, row if isinstance(row, dict) else RowError("Each line must be a JSON object!")
+
+
+def _text(row, field):
+    # a stripped string, '' when missing; JSON rows may hold any type
+    value = row.get(field)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise RowError(f"{field} must be a string!")
+    return value.strip()
+
+
+def validate(row):
+    if isinstance(row, RowError):
+        raise row
+
+    name = _text(row, 'name')
+    if not name:
+        raise RowError("name is required!")
+    if len(name) > 100:
+        raise RowError("name must be at most 100 characters!")
+
+    try:
+        price = float(row.get('price'))
+    except (TypeError, ValueError):
+        raise RowError("price must be a number!")
+    if not math.isfinite(price) or price < 0:
+        raise RowError("price must be a non-negative number!")
+
+    image_url = _text(row, 'image_url')
+    if not image_url:
+        raise RowError("image_url is required!")
+
+    category = _text(row, 'category') or None
+    if category and len(category) > 255:
+        raise RowError("category must be at most 255 characters!")
+
+    return {'name': name, 'price': price, 'category': category, 'image_url': image_url}
+
+
+def insert_batch(batch, vendor_id=None):
+    # one multi-row INSERT ... RETURNING for the products, one for their vendor links.
+    # The whole batch shares one catalog version instead of taking one per row.
+    # RETURNING carries what the search index needs, so the rows do not have
+    # to come back in parameter order (which SQLite can only promise by
+    # inserting them one at a time).
+    table = Product.__table__
+    version = advance_catalog_version(db.session.connection())
+    indexed = [
+        IndexedProduct(*row) for row in db.session.execute(
+            insert(table).returning(table.c.id, table.c.name, table.c.category),
+            [dict(values, version=version) for values in batch],
+        )
+    ]
+    product_ids = [product.id for product in indexed]
+
+    if vendor_id is not None:
+        db.session.execute(
+            insert(vendor_products),
+            [{'vendor_id': vendor_id, 'product_id': product_id} for product_id in product_ids],
+        )
+
+    product_search.upsert(*indexed)
+    db.session.commit()
+    return product_ids
+
+
+def import_products(rows, batch_size, vendor_id=None):
+    report = {'inserted': 0, 'failed': 0, 'errors': []}
+
+    def fail(number, message):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': number, 'message': message})
+
+    def flush(batch, numbers):
+        try:
+            report['inserted'] += len(insert_batch(batch, vendor_id))
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            for number in numbers:
+                fail(number, f"Batch insert failed: {e.__class__.__name__}")
+
+    batch, numbers = [], []
+    for number, row in rows:
+        try:
+            batch.append(validate(row))
+            numbers.append(number)
+        except RowError as e:
+            fail(number, str(e))
+            continue
+
+        if len(batch) >= batch_size:
+            flush(batch, numbers)
+            batch, numbers = [], []
+
+    if batch:
+        flush(batch, numbers)
+    return report
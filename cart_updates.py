@@ -0,0 +1,110 @@
+from sqlalchemy import and_, bindparam, delete, insert, select, update
+
+from models import db, Product, cart_products
+from pagination import is_int64
+
+
+class CartUpdateError(ValueError):
+    pass
+
+
+def _product_id(value):
+    if not is_int64(value):
+        raise CartUpdateError("product ids must be integers!")
+    return value
+
+
+def _quantity(value, allow_zero=False):
+    if not is_int64(value) or value < (0 if allow_zero else 1):
+        raise CartUpdateError("quantity must be a positive integer!")
+    return value
+
+
+def _items(data, key, allow_zero=False):
+    items = data.get(key) or []
+    if not isinstance(items, list):
+        raise CartUpdateError(f"{key} must be a list!")
+    parsed = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise CartUpdateError(f"{key} entries must be objects with product_id and quantity!")
+        parsed.append((_product_id(item.get('product_id')), _quantity(item.get('quantity', 1), allow_zero)))
+    return parsed
+
+
+def apply_cart_changes(cart_id, data):
+    # Applies, in order: `product_ids` (replace the whole cart, keeping the
+    # quantities of products that stay), `set` (quantity 0 removes), `add`
+    # (increments) and `remove`. Only rows whose quantity actually changes
+    # are written. Returns the ids that do not match any product.
+    replace = data.get('product_ids')
+    if replace is not None:
+        if not isinstance(replace, list):
+            raise CartUpdateError("product_ids must be a list!")
+        replace = [_product_id(product_id) for product_id in replace]
+    to_set = _items(data, 'set', allow_zero=True)
+    to_add = _items(data, 'add')
+    to_remove = data.get('remove') or []
+    if not isinstance(to_remove, list):
+        raise CartUpdateError("remove must be a list!")
+    to_remove = [_product_id(product_id) for product_id in to_remove]
+
+    requested = set(replace or ()) | {p for p, _ in to_set} | {p for p, _ in to_add} | set(to_remove)
+
+    # a single IN query resolves which ids exist and what the cart holds for them
+    current = {}
+    known = set()
+    if requested:
+        rows = db.session.execute(
+            select(Product.id, cart_products.c.quantity)
+            .outerjoin(cart_products, and_(cart_products.c.product_id == Product.id, cart_products.c.cart_id == cart_id))
+            .where(Product.id.in_(requested))
+        )
+        for product_id, quantity in rows:
+            known.add(product_id)
+            if quantity is not None:
+                current[product_id] = quantity
+
+    if replace is not None:
+        # everything outside the new list goes in one DELETE
+        keep = [product_id for product_id in replace if product_id in known]
+        db.session.execute(
+            delete(cart_products).where(cart_products.c.cart_id == cart_id, cart_products.c.product_id.not_in(keep))
+        )
+        current = {product_id: current[product_id] for product_id in keep if product_id in current}
+        target = {product_id: current.get(product_id, 1) for product_id in keep}
+    else:
+        target = dict(current)
+
+    for product_id, quantity in to_set:
+        if product_id in known:
+            if quantity:
+                target[product_id] = quantity
+            else:
+                target.pop(product_id, None)
+    for product_id, quantity in to_add:
+        if product_id in known:
+            target[product_id] = target.get(product_id, 0) + quantity
+    for product_id in to_remove:
+        target.pop(product_id, None)
+
+    # diff against what is stored
+    inserts = [{'cart_id': cart_id, 'product_id': p, 'quantity': q} for p, q in target.items() if p not in current]
+    updates = [{'c_id': cart_id, 'p_id': p, 'qty': q} for p, q in target.items() if p in current and current[p] != q]
+    deletes = [p for p in current if p not in target]
+
+    if inserts:
+        db.session.execute(insert(cart_products), inserts)
+    if updates:
+        db.session.execute(
+            update(cart_products)
+            .where(cart_products.c.cart_id == bindparam('c_id'), cart_products.c.product_id == bindparam('p_id'))
+            .values(quantity=bindparam('qty')),
+            updates,
+        )
+    if deletes:
+        db.session.execute(
+            delete(cart_products).where(cart_products.c.cart_id == cart_id, cart_products.c.product_id.in_(deletes))
+        )
+
+    return sorted(requested - known)
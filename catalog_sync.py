@@ -0,0 +1,98 @@
+from datetime import timedelta
+
+from sqlalchemy import delete, select, tuple_, update
+
+from models import db, CatalogSequence, Product, ProductTombstone, advance_catalog_version, product_serializer, utcnow
+from pagination import PaginationError, decode_cursor, encode_cursor, is_int64
+
+
+# Every product insert and update takes a new Product.version from the
+# catalog sequence (see models.advance_catalog_version); deletes leave a
+# tombstone with a version of its own. A client that remembers the last
+# (version, id) it applied can ask for exactly what changed after it.
+
+
+def catalog_version():
+    # the last version handed out; moves with every committed catalog write
+    return db.session.execute(select(CatalogSequence.value).where(CatalogSequence.id == 1)).scalar() or 0
+
+
+class CursorExpiredError(PaginationError):
+    pass
+
+
+def parse_since(cursor):
+    if not cursor:
+        return 0, 0
+    position = decode_cursor(cursor)
+    if not isinstance(position, dict) or not is_int64(position.get('version')) or not is_int64(position.get('id')):
+        raise PaginationError("Invalid cursor!")
+    pruned_through = db.session.execute(
+        select(CatalogSequence.pruned_through).where(CatalogSequence.id == 1)
+    ).scalar()
+    if position['version'] < (pruned_through or 0):
+        raise CursorExpiredError("Cursor is older than the retained change history; sync again without 'since'!")
+    return position['version'], position['id']
+
+
+def record_deletion(product_id):
+    # in the caller's transaction, next to the DELETE of the product
+    version = advance_catalog_version(db.session.connection())
+    db.session.merge(ProductTombstone(product_id=product_id, version=version, deleted_at=utcnow()))
+
+
+def catalog_changes(since, limit, fields=None):
+    # (changes, cursor, has_more): products written and deleted after
+    # `since`, oldest first, as {"op": "upsert" | "delete", ...}
+    version, last_id = since
+    products = (
+        Product.query
+        .options(*product_serializer.options(fields, Product.version))
+        .filter(tuple_(Product.version, Product.id) > tuple_(version, last_id))
+        .order_by(Product.version, Product.id)
+        .limit(limit + 1)
+        .all()
+    )
+    tombstones = (
+        ProductTombstone.query
+        .filter(tuple_(ProductTombstone.version, ProductTombstone.product_id) > tuple_(version, last_id))
+        .order_by(ProductTombstone.version, ProductTombstone.product_id)
+        .limit(limit + 1)
+        .all()
+    )
+
+    merged = sorted(
+        [(product.version, product.id, 'upsert', product) for product in products]
+        + [(tombstone.version, tombstone.product_id, 'delete', tombstone) for tombstone in tombstones],
+        key=lambda change: change[:2],
+    )
+    has_more = len(merged) > limit
+    merged = merged[:limit]
+
+    serialize = product_serializer.compile(fields)
+    changes = [
+        {'op': 'upsert', 'version': change_version, 'product': serialize(row)} if op == 'upsert'
+        else {'op': 'delete', 'version': change_version, 'product_id': change_id}
+        for change_version, change_id, op, row in merged
+    ]
+    if merged:
+        version, last_id = merged[-1][:2]
+    return changes, encode_cursor({'version': version, 'id': last_id}), has_more
+
+
+def prune_tombstones(older_than_days):
+    # Drops tombstones older than the retention window. Cursors from before
+    # the newest pruned tombstone then get a 410 and must resync in full.
+    cutoff = utcnow() - timedelta(days=older_than_days)
+    newest = db.session.execute(
+        select(db.func.max(ProductTombstone.version)).where(ProductTombstone.deleted_at < cutoff)
+    ).scalar()
+    if newest is None:
+        return 0
+    deleted = db.session.execute(delete(ProductTombstone).where(ProductTombstone.version <= newest)).rowcount
+    db.session.execute(
+        update(CatalogSequence)
+        .where(CatalogSequence.id == 1, CatalogSequence.pruned_through < newest)
+        .values(pruned_through=newest)
+    )
+    return deleted
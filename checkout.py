@@ -0,0 +1,62 @@
+from sqlalchemy import delete, func, select
+
+from analytics import record_order
+from inventory import reserve_cart
+from order_workflow import order_placed
+from models import db, Order, Product, cart_products, vendor_products
+
+
+class CheckoutError(ValueError):
+    pass
+
+
+def cart_totals_by_vendor(cart_id):
+    # [(vendor_id, total, lines)] for the cart, computed in the database.
+    # A product sold by several vendors is billed to the lowest vendor id.
+    in_cart = select(cart_products.c.product_id).where(cart_products.c.cart_id == cart_id)
+    seller = (
+        select(vendor_products.c.product_id, func.min(vendor_products.c.vendor_id).label('vendor_id'))
+        .where(vendor_products.c.product_id.in_(in_cart))
+        .group_by(vendor_products.c.product_id)
+        .subquery()
+    )
+    return db.session.execute(
+        select(seller.c.vendor_id, func.sum(Product.price * cart_products.c.quantity), func.count())
+        .select_from(cart_products)
+        .join(Product, Product.id == cart_products.c.product_id)
+        .outerjoin(seller, seller.c.product_id == cart_products.c.product_id)
+        .where(cart_products.c.cart_id == cart_id)
+        .group_by(seller.c.vendor_id)
+        .order_by(seller.c.vendor_id)
+    ).all()
+
+
+def checkout_cart(cart):
+    # Creates one Order per vendor, takes the items out of stock and empties
+    # the cart, all inside the caller's transaction; the caller commits or
+    # rolls back. Raises CheckoutError, or inventory.OutOfStockError.
+    totals = cart_totals_by_vendor(cart.id)
+    if not totals:
+        raise CheckoutError("Cart is empty!")
+    if any(vendor_id is None for vendor_id, _, _ in totals):
+        raise CheckoutError("Some products in the cart are not sold by any vendor!")
+
+    reserve_cart(cart.id)
+
+    orders = [
+        Order(buyer_id=cart.buyer_id, vendor_id=vendor_id, total_price=round(total, 2))
+        for vendor_id, total, _ in totals
+    ]
+    db.session.add_all(orders)
+
+    # if a concurrent checkout already emptied the cart, fewer rows go away
+    # than were priced above and this checkout must not go through
+    deleted = db.session.execute(delete(cart_products).where(cart_products.c.cart_id == cart.id)).rowcount
+    if deleted != sum(lines for _, _, lines in totals):
+        raise CheckoutError("Cart changed during checkout, please retry!")
+
+    db.session.flush()
+    for order in orders:
+        record_order(order)
+        order_placed(order)
+    return orders
@@ -0,0 +1,82 @@
+import functools
+import os
+import sqlite3
+
+from flask import g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+REPLICA_BIND = 'replica'
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options(uri):
+    # Pool settings for server databases, from the environment. SQLite gets
+    # its tuning from the connect-time pragmas below instead.
+    if not uri or uri.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': _env_int('DB_POOL_SIZE', 5),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', True),
+    }
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer instead of every
+    # gunicorn worker queueing on the rollback journal's database lock
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')}")
+    cursor.execute(f"PRAGMA synchronous={os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+    cursor.execute(f"PRAGMA busy_timeout={_env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)}")
+    cursor.close()
+
+
+def configure_engines(app):
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(uri))
+
+    replica_uri = os.environ.get('SQLALCHEMY_REPLICA_URI')
+    if replica_uri:
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds[REPLICA_BIND] = {'url': replica_uri, **engine_options(replica_uri)}
+
+
+class RoutingSession(Session):
+    # Sends reads to the replica bind while a view wrapped in replica_reads
+    # is handling a GET. Anything flushing, or explicitly bound, stays on
+    # the primary.
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is None and not self._flushing and has_app_context() and g.get('read_replica'):
+            engines = self._db.engines
+            replica = engines.get(REPLICA_BIND)
+            if replica is not None and engine is engines.get(None):
+                return replica
+        return engine
+
+
+def replica_reads(view):
+    # For views whose GET branch only reads data that can lag the primary
+    # slightly (the catalog, not a buyer's own cart or orders).
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method == 'GET':
+            g.read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,97 @@
+# Loaded automatically by `gunicorn app:app`; every setting can be overridden
+# from the environment, e.g. WEB_CONCURRENCY=4 GUNICORN_WORKER_CLASS=gevent.
+import multiprocessing
+import os
+
+
+def _flag(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# sync: one request per process; gthread: a thread pool per process, good for
+# routes that mostly wait on the database; gevent: cooperative workers for
+# many idle or long-lived connections (needs `pip install gevent`, and
+# psycogreen for Postgres).
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'sync':
+    default_workers = cpus * 2 + 1
+elif worker_class == 'gevent':
+    default_workers = cpus
+else:
+    default_workers = cpus + 1
+
+workers = int(os.environ.get('WEB_CONCURRENCY', default_workers))
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Every open /orders/stream holds a gthread thread for its whole life (up to
+# ORDER_STREAM_MAX_SECONDS), but only a parked greenlet under gevent. Past
+# this many per worker the app answers 503, so streams can never take all
+# of a worker's threads; a sync worker has none to spare.
+if worker_class == 'gevent':
+    default_streams = worker_connections // 2
+elif worker_class == 'sync':
+    default_streams = 0
+else:
+    default_streams = threads // 2
+os.environ.setdefault('ORDER_STREAM_MAX_CONNECTIONS', str(default_streams))
+
+# import the app once in the master; workers share its memory copy-on-write
+preload_app = _flag('GUNICORN_PRELOAD', True)
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# recycle workers now and then, staggered so they do not restart together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 500))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+
+
+def _dispose_engines(close):
+    from app import app
+    from models import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
+def when_ready(server):
+    # Runs in the master before any worker is forked. With preload, caches
+    # warmed here are inherited by every worker; the connections used to fill
+    # them must not be, so the pools are emptied again.
+    if preload_app:
+        from app import warm_up
+
+        warm_up(caches=True, connections=False)
+        _dispose_engines(close=True)
+
+
+def post_fork(server, worker):
+    # never reuse a database socket that another process may also hold
+    if preload_app:
+        _dispose_engines(close=False)
+
+
+def post_worker_init(worker):
+    # fill the connection pool (and caches, without preload) before the
+    # worker starts accepting requests
+    from app import warm_up
+
+    warm_up(caches=not preload_app, connections=True)
+
+    # JOB_WORKER_IN_PROCESS=1 runs the background job loop inside each web
+    # worker instead of a separate `flask jobs work` process
+    from app import app
+    from jobs import job_queue
+
+    if app.config['JOB_WORKER_IN_PROCESS']:
+        job_queue.start_worker()
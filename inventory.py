@@ -0,0 +1,232 @@
+import random
+
+from sqlalchemy import and_, delete, func, insert, select, update
+
+from models import db, InventoryShard, Product, cart_products, vendor_products
+from pagination import is_int64
+
+
+MAX_SHARDS = 64
+
+# Stock is not part of the synced catalog representation, so checkouts keep
+# the product's version (and stay off the catalog sequence row) by setting
+# the columns to themselves instead of letting onupdate bump them.
+UNVERSIONED = {'version': Product.version, 'updated_at': Product.updated_at}
+
+
+class InventoryError(ValueError):
+    pass
+
+
+class OutOfStockError(InventoryError):
+
+    def __init__(self, product_ids):
+        super().__init__("Not enough stock for some products in the cart!")
+        self.product_ids = product_ids
+
+
+def _decrement_product(product_id, quantity):
+    # one conditional UPDATE: never reads the stock, never goes below zero
+    return db.session.execute(
+        update(Product.__table__)
+        .where(Product.id == product_id, Product.stock >= quantity)
+        .values(stock=Product.stock - quantity, **UNVERSIONED)
+    ).rowcount == 1
+
+
+def _decrement_vendor(vendor_id, product_id, quantity):
+    return db.session.execute(
+        update(vendor_products)
+        .where(
+            vendor_products.c.vendor_id == vendor_id,
+            vendor_products.c.product_id == product_id,
+            vendor_products.c.stock >= quantity,
+        )
+        .values(stock=vendor_products.c.stock - quantity)
+    ).rowcount == 1
+
+
+def _take_from_shard(product_id, shard, quantity):
+    table = InventoryShard.__table__
+    return db.session.execute(
+        update(table)
+        .where(table.c.product_id == product_id, table.c.shard == shard, table.c.stock >= quantity)
+        .values(stock=table.c.stock - quantity)
+    ).rowcount == 1
+
+
+def _decrement_sharded(product_id, shards, quantity):
+    # Start at a random shard so concurrent checkouts of the same product
+    # land on different rows; walk the others when that one runs dry.
+    start = random.randrange(shards)
+    order = [(start + offset) % shards for offset in range(shards)]
+    for shard in order:
+        if _take_from_shard(product_id, shard, quantity):
+            return True
+
+    # no single shard holds enough: gather it from several, still with
+    # conditional updates. The caller rolls back if it comes up short.
+    table = InventoryShard.__table__
+    remaining = quantity
+    levels = dict(db.session.execute(
+        select(table.c.shard, table.c.stock).where(table.c.product_id == product_id, table.c.stock > 0)
+    ).all())
+    for shard in order:
+        take = min(levels.get(shard, 0), remaining)
+        if take and _take_from_shard(product_id, shard, take):
+            remaining -= take
+        if not remaining:
+            return True
+    return False
+
+
+def cart_lines(cart_id):
+    # [(product_id, vendor_id, quantity, stock tracked, shards, vendor stock tracked)]
+    # for a cart, billed to the same (lowest id) vendor as checkout.cart_totals_by_vendor
+    seller = (
+        select(vendor_products.c.product_id, func.min(vendor_products.c.vendor_id).label('vendor_id'))
+        .where(vendor_products.c.product_id.in_(
+            select(cart_products.c.product_id).where(cart_products.c.cart_id == cart_id)
+        ))
+        .group_by(vendor_products.c.product_id)
+        .subquery()
+    )
+    return db.session.execute(
+        select(
+            cart_products.c.product_id,
+            seller.c.vendor_id,
+            cart_products.c.quantity,
+            Product.stock.is_not(None),
+            Product.stock_shards,
+            vendor_products.c.stock.is_not(None),
+        )
+        .select_from(cart_products)
+        .join(Product, Product.id == cart_products.c.product_id)
+        .outerjoin(seller, seller.c.product_id == cart_products.c.product_id)
+        .outerjoin(vendor_products, and_(
+            vendor_products.c.product_id == seller.c.product_id,
+            vendor_products.c.vendor_id == seller.c.vendor_id,
+        ))
+        .where(cart_products.c.cart_id == cart_id)
+        .order_by(cart_products.c.product_id)
+    ).all()
+
+
+def reserve_cart(cart_id):
+    # Takes the cart's quantities out of stock, in the caller's transaction.
+    # Untracked products cost nothing beyond the cart_lines() read. Rows are
+    # touched in product id order, so concurrent checkouts lock in the same
+    # order and cannot deadlock. Raises OutOfStockError; the caller must
+    # roll back, which also undoes the decrements that did succeed.
+    short = []
+    for product_id, vendor_id, quantity, tracked, shards, vendor_tracked in cart_lines(cart_id):
+        if shards:
+            reserved = _decrement_sharded(product_id, shards, quantity)
+        elif tracked:
+            reserved = _decrement_product(product_id, quantity)
+        else:
+            reserved = True
+        if reserved and vendor_tracked:
+            reserved = _decrement_vendor(vendor_id, product_id, quantity)
+        if not reserved:
+            short.append(product_id)
+    if short:
+        raise OutOfStockError(short)
+
+
+def stock_levels(product):
+    table = InventoryShard.__table__
+    if product.stock_shards:
+        stock = db.session.execute(
+            select(func.coalesce(func.sum(table.c.stock), 0)).where(table.c.product_id == product.id)
+        ).scalar()
+    else:
+        stock = product.stock
+    vendors = db.session.execute(
+        select(vendor_products.c.vendor_id, vendor_products.c.stock)
+        .where(vendor_products.c.product_id == product.id)
+        .order_by(vendor_products.c.vendor_id)
+    ).all()
+    return {
+        'product_id': product.id,
+        'tracked': stock is not None,
+        'stock': stock,
+        'shards': product.stock_shards,
+        'vendors': [{'vendor_id': vendor_id, 'stock': vendor_stock} for vendor_id, vendor_stock in vendors],
+    }
+
+
+def _count(value, name, allow_none=False):
+    if value is None and allow_none:
+        return None
+    if not is_int64(value) or value < 0:
+        raise InventoryError(f"{name} must be a non-negative integer{' or null' if allow_none else ''}!")
+    return value
+
+
+def set_stock(product, stock, shards=None):
+    # Sets the absolute stock level (None stops tracking). shards > 0 splits
+    # it evenly over that many rows for contention-free checkouts.
+    stock = _count(stock, 'stock', allow_none=True)
+    shards = product.stock_shards if shards is None else _count(shards, 'shards')
+    if shards > MAX_SHARDS:
+        raise InventoryError(f"shards can be at most {MAX_SHARDS}!")
+    if stock is None:
+        shards = 0
+
+    table = InventoryShard.__table__
+    db.session.execute(delete(table).where(table.c.product_id == product.id))
+    if shards:
+        share, extra = divmod(stock, shards)
+        db.session.execute(insert(table), [
+            {'product_id': product.id, 'shard': shard, 'stock': share + (1 if shard < extra else 0)}
+            for shard in range(shards)
+        ])
+        stock = None
+    # a Core UPDATE, so the catalog version stays put (see UNVERSIONED)
+    db.session.execute(
+        update(Product.__table__)
+        .where(Product.id == product.id)
+        .values(stock=stock, stock_shards=shards, **UNVERSIONED)
+    )
+    db.session.expire(product, ['stock', 'stock_shards'])
+
+
+def adjust_stock(product, delta):
+    # Relative change (a delivery, a write-off) that never reads the level
+    # first, so it cannot race with checkouts.
+    if not is_int64(delta):
+        raise InventoryError("adjust must be an integer!")
+    if product.stock_shards:
+        if delta >= 0:
+            table = InventoryShard.__table__
+            db.session.execute(
+                update(table)
+                .where(table.c.product_id == product.id, table.c.shard == random.randrange(product.stock_shards))
+                .values(stock=table.c.stock + delta)
+            )
+        elif not _decrement_sharded(product.id, product.stock_shards, -delta):
+            raise InventoryError("Not enough stock to remove!")
+        return
+
+    if product.stock is None:
+        raise InventoryError("Stock is not tracked for this product; set stock first!")
+    adjusted = db.session.execute(
+        update(Product.__table__)
+        .where(Product.id == product.id, Product.stock + delta >= 0)
+        .values(stock=Product.stock + delta, **UNVERSIONED)
+    ).rowcount
+    if not adjusted:
+        raise InventoryError("Not enough stock to remove!")
+    db.session.expire(product, ['stock'])
+
+
+def set_vendor_stock(vendor_id, product_id, stock):
+    stock = _count(stock, 'vendor_stock', allow_none=True)
+    updated = db.session.execute(
+        update(vendor_products)
+        .where(vendor_products.c.vendor_id == vendor_id, vendor_products.c.product_id == product_id)
+        .values(stock=stock)
+    ).rowcount
+    if not updated:
+        raise InventoryError("You do not sell this product!")
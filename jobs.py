@@ -0,0 +1,200 @@
+import logging
+import random
+import threading
+import traceback
+from datetime import timedelta
+
+import click
+from sqlalchemy import and_, func, or_, select, update
+
+from models import db, Job, utcnow
+
+
+logger = logging.getLogger('safarivendors.jobs')
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueue:
+    # Jobs are rows in the `jobs` outbox table. enqueue() only adds a row
+    # to the caller's session, so the request path pays for one INSERT and
+    # the job exists exactly when the caller's transaction commits. Workers
+    # (`flask jobs work`, or a thread per process with JOB_WORKER_IN_PROCESS)
+    # claim due rows, run the registered handler and retry failures with
+    # exponential backoff until max_attempts.
+
+    def __init__(self, app=None):
+        self.handlers = {}
+        self.stopping = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_MAX_ATTEMPTS', 5)
+        app.config.setdefault('JOB_BACKOFF_SECONDS', 5)
+        app.config.setdefault('JOB_BACKOFF_MAX_SECONDS', 3600)
+        # a running job whose worker died is picked up again after this long
+        app.config.setdefault('JOB_LOCK_TIMEOUT', 300)
+        app.config.setdefault('JOB_POLL_INTERVAL', 1.0)
+        app.config.setdefault('JOB_BATCH_SIZE', 10)
+        app.config.setdefault('JOB_WORKER_IN_PROCESS', False)
+        self.app = app
+        app.extensions['job_queue'] = self
+
+        @app.cli.group('jobs')
+        def jobs_cli():
+            """Run and inspect background jobs."""
+
+        @jobs_cli.command('work')
+        @click.option('--once', is_flag=True, help="Run the jobs that are due, then exit.")
+        @click.option('--batch-size', type=int, default=None, help="Jobs claimed per round trip.")
+        def work_command(once, batch_size):
+            processed = self.work(once=once, batch_size=batch_size)
+            print(f"Processed {processed} jobs.")
+
+        @jobs_cli.command('stats')
+        def stats_command():
+            for status, count in self.stats().items():
+                print(f"{status}: {count}")
+
+        @jobs_cli.command('retry-failed')
+        def retry_failed_command():
+            retried = self.retry_failed()
+            db.session.commit()
+            print(f"Requeued {retried} failed jobs.")
+
+    def handler(self, kind):
+        def register(function):
+            self.handlers[kind] = function
+            return function
+        return register
+
+    def enqueue(self, kind, payload, delay=0, max_attempts=None):
+        # in the caller's transaction; the caller commits
+        if kind not in self.handlers:
+            raise KeyError(f"No handler registered for job '{kind}'")
+        job = Job(
+            kind=kind,
+            payload=payload,
+            max_attempts=max_attempts or self.app.config['JOB_MAX_ATTEMPTS'],
+            run_at=utcnow() + timedelta(seconds=delay),
+        )
+        db.session.add(job)
+        return job
+
+    def backoff(self, attempts):
+        # exponential with full jitter, so retries of a burst spread out
+        base = self.app.config['JOB_BACKOFF_SECONDS'] * 2 ** (attempts - 1)
+        return random.uniform(0, min(base, self.app.config['JOB_BACKOFF_MAX_SECONDS']))
+
+    def claim(self, batch_size):
+        # Marks up to batch_size due jobs as running and returns their ids.
+        # The conditional UPDATE is what makes a claim exclusive: of several
+        # workers racing for a row, only one sees rowcount 1.
+        now = utcnow()
+        stale = now - timedelta(seconds=self.app.config['JOB_LOCK_TIMEOUT'])
+        due = or_(
+            and_(Job.status == PENDING, Job.run_at <= now),
+            and_(Job.status == RUNNING, Job.locked_at < stale),
+        )
+        candidates = db.session.execute(
+            select(Job.id, Job.status, Job.locked_at)
+            .where(due)
+            .order_by(Job.run_at, Job.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+
+        claimed = []
+        for job_id, status, locked_at in candidates:
+            unchanged = Job.locked_at.is_(None) if locked_at is None else Job.locked_at == locked_at
+            taken = db.session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == status, unchanged)
+                .values(status=RUNNING, locked_at=now, attempts=Job.attempts + 1)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if taken:
+                claimed.append(job_id)
+        db.session.commit()
+        return claimed
+
+    def run(self, job_id):
+        # Runs one claimed job. The handler's writes and the job's own
+        # status change commit together; a failure rolls the handler back.
+        job = db.session.get(Job, job_id)
+        handler = self.handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job '{job.kind}'")
+            handler(job.payload)
+            job.status = DONE
+            job.finished_at = utcnow()
+            job.last_error = None
+            db.session.commit()
+            return True
+        except Exception:
+            db.session.rollback()
+            job = db.session.get(Job, job_id)
+            job.last_error = traceback.format_exc(limit=5)
+            if job.attempts >= job.max_attempts:
+                job.status = FAILED
+                job.finished_at = utcnow()
+                logger.error("job %s (%s) failed after %s attempts", job.id, job.kind, job.attempts)
+            else:
+                job.status = PENDING
+                job.run_at = utcnow() + timedelta(seconds=self.backoff(job.attempts))
+                logger.warning("job %s (%s) failed, retrying at %s", job.id, job.kind, job.run_at)
+            db.session.commit()
+            return False
+
+    def work(self, once=False, batch_size=None):
+        batch_size = batch_size or self.app.config['JOB_BATCH_SIZE']
+        processed = 0
+        while not self.stopping.is_set():
+            claimed = self.claim(batch_size)
+            for job_id in claimed:
+                self.run(job_id)
+                processed += 1
+            db.session.remove()
+            if once and not claimed:
+                break
+            if not claimed:
+                self.stopping.wait(self.app.config['JOB_POLL_INTERVAL'])
+        return processed
+
+    def start_worker(self):
+        # a daemon thread running the worker loop inside this process
+        def loop():
+            with self.app.app_context():
+                while not self.stopping.is_set():
+                    try:
+                        self.work()
+                    except Exception:
+                        logger.exception("job worker crashed, restarting")
+                        db.session.remove()
+                        self.stopping.wait(self.app.config['JOB_POLL_INTERVAL'])
+
+        thread = threading.Thread(target=loop, name='job-worker', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopping.set()
+
+    def stats(self):
+        return dict(db.session.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+
+    def retry_failed(self):
+        return db.session.execute(
+            update(Job)
+            .where(Job.status == FAILED)
+            .values(status=PENDING, attempts=0, run_at=utcnow(), finished_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+
+job_queue = JobQueue()
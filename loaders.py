@@ -0,0 +1,26 @@
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import Buyer, Cart, Product, Review, Vendor
+
+
+# Loader options per response shape. A view passes the profiles for the
+# relationships its serializer walks, so the whole graph comes back in a
+# fixed number of queries: joinedload for many-to-one (the same SELECT,
+# one row each), selectinload for collections (one SELECT ... IN for the
+# whole page). Left to lazy=True, each of these is a query per row.
+PROFILES = {
+    'cart': (
+        joinedload(Cart.buyer).load_only(Buyer.id, Buyer.username),
+    ),
+    'review': (
+        joinedload(Review.buyer).load_only(Buyer.id, Buyer.username),
+        joinedload(Review.vendor).load_only(Vendor.id, Vendor.username),
+    ),
+    'product_vendors': (
+        selectinload(Product.vendors).load_only(Vendor.id, Vendor.username),
+    ),
+}
+
+
+def load_profile(*names):
+    return tuple(option for name in names for option in PROFILES[name])
@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger('safarivendors.sql')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self.series = defaultdict(lambda: [0] * (len(buckets) + 1) + [0.0])
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series[labels]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            snapshot = {labels: list(series) for labels, series in self.series.items()}
+        for labels, series in sorted(snapshot.items()):
+            pairs = list(zip(self.label_names, labels))
+            cumulative = 0
+            for bound, observed in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += observed
+                lines.append(f'{self.name}_bucket{_labels(pairs + [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(pairs)} {series[-1]}')
+            lines.append(f'{self.name}_count{_labels(pairs)} {cumulative}')
+        return lines
+
+
+class _CountedBody:
+    # Wraps a streamed body to count the bytes actually written out.
+
+    def __init__(self, body):
+        self.body = body
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        close = getattr(self.body, 'close', None)
+        if close is not None:
+            close()
+
+
+class RequestMetrics:
+    # Times every request and the SQL it runs. Counts are kept per worker
+    # process, so under gunicorn each scrape of /metrics sees one worker.
+    #
+    # A streamed response does its work (and often its queries) while the
+    # server writes the body, after the view has returned, so it is only
+    # recorded once the body has been sent and the response closed.
+
+    def __init__(self, app=None):
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', "Time spent handling the request.",
+            ('method', 'route', 'status'), LATENCY_BUCKETS,
+        )
+        self.query_count = Histogram(
+            'db_queries_per_request', "SQL statements executed per request.",
+            ('method', 'route'), QUERY_COUNT_BUCKETS,
+        )
+        self.db_duration = Histogram(
+            'db_time_per_request_seconds', "Time spent in SQL statements per request.",
+            ('method', 'route'), LATENCY_BUCKETS,
+        )
+        self.response_size = Histogram(
+            'http_response_size_bytes', "Size of the response body sent.",
+            ('method', 'route'), SIZE_BUCKETS,
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_MS', None)
+        # None means "only in debug mode"
+        app.config.setdefault('METRICS_DEBUG_HEADERS', None)
+        self.app = app
+        app.extensions['request_metrics'] = self
+
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(Engine, 'handle_error', self._handle_error)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.render_endpoint, methods=['GET'])
+
+    @staticmethod
+    def _route():
+        return request.url_rule.rule if request.url_rule else '<unmatched>'
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_time = 0.0
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append((context, time.perf_counter()))
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_started'].pop()[1]
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_queries += 1
+            g.metrics_db_time += elapsed
+
+        slow_ms = self.app.config['SLOW_QUERY_MS']
+        if slow_ms is not None and elapsed * 1000 >= slow_ms:
+            route = f'{request.method} {self._route()}' if has_request_context() else '-'
+            logger.warning("slow query (%.1f ms) in %s: %s", elapsed * 1000, route, statement)
+
+    def _handle_error(self, exception_context):
+        # a statement that raised never reaches after_cursor_execute; drop its
+        # start time, or the connection carries it back to the pool for good
+        connection = exception_context.connection
+        if connection is None:
+            return
+        started = connection.info.get('metrics_started')
+        if started and started[-1][0] is exception_context.execution_context:
+            started.pop()
+
+    def _after_request(self, response):
+        if 'metrics_started' not in g:
+            return response
+        # read at the end, so queries made while streaming are counted too
+        counters = g._get_current_object()
+        method, route, status = request.method, self._route(), str(response.status_code)
+
+        def observe(size):
+            elapsed = time.perf_counter() - counters.metrics_started
+            self.request_duration.observe((method, route, status), elapsed)
+            self.query_count.observe((method, route), counters.metrics_queries)
+            self.db_duration.observe((method, route), counters.metrics_db_time)
+            self.response_size.observe((method, route), size)
+            return elapsed
+
+        if response.is_streamed:
+            body = response.response = _CountedBody(response.response)
+            response.call_on_close(lambda: observe(body.size))
+            elapsed = time.perf_counter() - g.metrics_started
+        else:
+            elapsed = observe(response.calculate_content_length() or 0)
+
+        debug_headers = self.app.config['METRICS_DEBUG_HEADERS']
+        if debug_headers or (debug_headers is None and self.app.debug):
+            # for a streamed response, what was done before the body started
+            response.headers['X-Query-Count'] = str(g.metrics_queries)
+            response.headers['Server-Timing'] = (
+                f'db;dur={g.metrics_db_time * 1000:.2f};desc="{g.metrics_queries} queries", '
+                f'app;dur={elapsed * 1000:.2f}'
+            )
+        return response
+
+    def render(self):
+        lines = []
+        for histogram in (self.request_duration, self.query_count, self.db_duration, self.response_size):
+            lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
+
+    def render_endpoint(self):
+        return self.app.response_class(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,32 @@
+"""Product keyset pagination indexes
+
+Revision ID: 3c1f9a2d7e41
+Revises: b5a706cdbe17
+Create Date: 2026-10-18 09:12:05.418310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f9a2d7e41'
+down_revision = 'b5a706cdbe17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.create_index('ix_products_category_price_id', ['category', 'price', 'id'], unique=False)
+        batch_op.create_index('ix_products_category_name_id', ['category', 'name', 'id'], unique=False)
+        batch_op.create_index('ix_products_price_id', ['price', 'id'], unique=False)
+        batch_op.create_index('ix_products_name_id', ['name', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index('ix_products_name_id')
+        batch_op.drop_index('ix_products_price_id')
+        batch_op.drop_index('ix_products_category_name_id')
+        batch_op.drop_index('ix_products_category_price_id')
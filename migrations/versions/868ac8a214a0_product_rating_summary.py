@@ -0,0 +1,71 @@
+"""Product rating summary
+
+Revision ID: 868ac8a214a0
+Revises: 273a77e20079
+Create Date: 2026-10-18 08:43:01.937264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '868ac8a214a0'
+down_revision = '273a77e20079'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('products', sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('products', sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('products', sa.Column('rating_avg', sa.Float(), server_default='0', nullable=False))
+    op.add_column('products', sa.Column('rating_1', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('products', sa.Column('rating_2', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('products', sa.Column('rating_3', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('products', sa.Column('rating_4', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('products', sa.Column('rating_5', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_products_category_rating_avg_id', 'products', ['category', 'rating_avg', 'id'], unique=False)
+    op.create_index('ix_products_rating_avg_id', 'products', ['rating_avg', 'id'], unique=False)
+
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('buyer_id', sa.Integer(), nullable=True))
+        batch_op.alter_column('vendor_id',
+               existing_type=sa.INTEGER(),
+               nullable=True)
+        batch_op.create_index(batch_op.f('ix_reviews_product_id'), ['product_id'], unique=False)
+        batch_op.create_foreign_key('fk_reviews_buyer_id_buyers', 'buyers', ['buyer_id'], ['id'])
+
+    # backfill the summaries from existing reviews
+    op.execute("""
+        UPDATE products SET
+            rating_count = (SELECT COUNT(*) FROM reviews WHERE reviews.product_id = products.id),
+            rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.product_id = products.id),
+            rating_avg = (SELECT COALESCE(AVG(rating * 1.0), 0) FROM reviews WHERE reviews.product_id = products.id),
+            rating_1 = (SELECT COUNT(*) FROM reviews WHERE reviews.product_id = products.id AND rating = 1),
+            rating_2 = (SELECT COUNT(*) FROM reviews WHERE reviews.product_id = products.id AND rating = 2),
+            rating_3 = (SELECT COUNT(*) FROM reviews WHERE reviews.product_id = products.id AND rating = 3),
+            rating_4 = (SELECT COUNT(*) FROM reviews WHERE reviews.product_id = products.id AND rating = 4),
+            rating_5 = (SELECT COUNT(*) FROM reviews WHERE reviews.product_id = products.id AND rating = 5)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_reviews_buyer_id_buyers', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_reviews_product_id'))
+        batch_op.alter_column('vendor_id',
+               existing_type=sa.INTEGER(),
+               nullable=False)
+        batch_op.drop_column('buyer_id')
+
+    op.drop_index('ix_products_rating_avg_id', table_name='products')
+    op.drop_index('ix_products_category_rating_avg_id', table_name='products')
+    op.drop_column('products', 'rating_5')
+    op.drop_column('products', 'rating_4')
+    op.drop_column('products', 'rating_3')
+    op.drop_column('products', 'rating_2')
+    op.drop_column('products', 'rating_1')
+    op.drop_column('products', 'rating_avg')
+    op.drop_column('products', 'rating_sum')
+    op.drop_column('products', 'rating_count')
@@ -0,0 +1,32 @@
+"""Product full-text search index
+
+Revision ID: 8e2b4f6a1d93
+Revises: 3c1f9a2d7e41
+Create Date: 2026-10-18 10:41:27.905112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2b4f6a1d93'
+down_revision = '3c1f9a2d7e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 only exists on SQLite; other databases use the in-process index in search.py
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(name, category, tokenize='unicode61 remove_diacritics 2')")
+    op.execute("INSERT INTO products_fts (rowid, name, category) SELECT id, name, COALESCE(category, '') FROM products")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("DROP TABLE IF EXISTS products_fts")
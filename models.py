@@ -1,21 +1,53 @@
+from datetime import datetime, timezone
+from operator import attrgetter
+
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import validates
 from sqlalchemy_serializer import SerializerMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from engine_profile import RoutingSession
+from serializers import Serializer, isoformat
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def utcnow():
+    # naive UTC, matching what db.func.now() stores on SQLite
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def advance_catalog_version(connection, count=1):
+    # Takes the next `count` catalog versions and returns the last one. The
+    # UPDATE locks the sequence row until the caller's transaction ends, so
+    # catalog writes commit in version order and a sync client that has seen
+    # version N can never later miss a commit numbered below N.
+    table = CatalogSequence.__table__
+    statement = db.update(table).where(table.c.id == 1).values(value=table.c.value + count)
+    if connection.dialect.update_returning:
+        return connection.execute(statement.returning(table.c.value)).scalar_one()
+    connection.execute(statement)
+    return connection.execute(db.select(table.c.value).where(table.c.id == 1)).scalar_one()
+
 
-db = SQLAlchemy()
+def next_catalog_version(context):
+    # default/onupdate of Product.version, in the statement's own transaction
+    return advance_catalog_version(context.connection)
 
 #association table for vendor and products
 vendor_products = db.Table('vendor_products',
     db.Column('vendor_id', db.Integer, db.ForeignKey('vendors.id'), primary_key=True),
-    db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True),
+    # this vendor's own stock of the product; NULL when not tracked
+    db.Column('stock', db.Integer, nullable=True)
 )
 
 
 cart_products = db.Table('cart_products',
     db.Column('cart_id', db.Integer, db.ForeignKey('carts.id'), primary_key=True),
-    db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True),
+    db.Column('quantity', db.Integer, nullable=False, default=1, server_default='1')
 )
 
 class Buyer(db.Model, SerializerMixin):
@@ -27,6 +59,7 @@ class Buyer(db.Model, SerializerMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), nullable=False, unique=True)
     email = db.Column(db.String(50), unique=True, nullable=False)
+    # legacy: logins use users.password since the users table was added
     password = db.Column(db.String(255))
     
     
@@ -53,6 +86,7 @@ class Vendor(db.Model, SerializerMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), nullable=False, unique=True)
     email = db.Column(db.String(50), unique=True, nullable=False)
+    # legacy: logins use users.password since the users table was added
     password = db.Column(db.String(255))
     
     
@@ -72,31 +106,85 @@ class Vendor(db.Model, SerializerMixin):
     reviews = db.relationship("Review", back_populates="vendor", lazy=True)
     
 
+class User(db.Model):
+    __tablename__ = "users"
+
+    # One login per person. The buyer and vendor rows are the profiles the
+    # rest of the schema points at; a user with both roles links to both.
+    # Passwords are hashed by accounts.py with PASSWORD_HASH_METHOD.
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(50), nullable=False, unique=True)
+    email = db.Column(db.String(50), nullable=False, unique=True)
+    password = db.Column(db.String(255), nullable=False)
+    # Set only for a buyer and a vendor account that shared an email before
+    # the merge and may have different passwords: this one opens the vendor
+    # profile, `password` the buyer profile, until a login proves they are
+    # the same (see accounts.authenticate).
+    vendor_password = db.Column(db.String(255), nullable=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('buyers.id'), nullable=True, unique=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendors.id'), nullable=True, unique=True)
+
+    buyer = db.relationship('Buyer', lazy=True)
+    vendor = db.relationship('Vendor', lazy=True)
+
+    @property
+    def user_type(self):
+        if self.buyer_id and self.vendor_id:
+            return 'both'
+        return 'vendor' if self.vendor_id else 'buyer'
+    
+
 class Product(db.Model, SerializerMixin):
     __tablename__ = "products"
     
     serialize_rules = ('-vendors.products', '-reviews.product') 
     
+    # keyset pagination indexes: (filter, sort key, id)
+    __table_args__ = (
+        db.Index('ix_products_category_price_id', 'category', 'price', 'id'),
+        db.Index('ix_products_category_name_id', 'category', 'name', 'id'),
+        db.Index('ix_products_price_id', 'price', 'id'),
+        db.Index('ix_products_name_id', 'name', 'id'),
+        db.Index('ix_products_category_rating_avg_id', 'category', 'rating_avg', 'id'),
+        db.Index('ix_products_rating_avg_id', 'rating_avg', 'id'),
+        # /products/changes reads forward from a (version, id) cursor
+        db.Index('ix_products_version_id', 'version', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     category = db.Column(db.String(255))
     price = db.Column(db.Float, nullable=False)
     image_url = db.Column(db.String, nullable=False)
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'category': self.category,
-            'price': self.price,
-            'image_url': self.image_url,
-        }
+    # rating summary, kept up to date by ratings.apply_rating_change()
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_avg = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    rating_1 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_2 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_3 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_4 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_5 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # inventory, see inventory.py: NULL stock means not tracked; with
+    # stock_shards > 0 the stock lives in that many inventory_shards rows
+    stock = db.Column(db.Integer, nullable=True)
+    stock_shards = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # bumped by every insert and update, see catalog_sync.py
+    version = db.Column(db.Integer, nullable=False, default=next_catalog_version, onupdate=next_catalog_version, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow, server_default=db.func.now())
+    
+    def to_dict(self, fields=None):
+        return product_serializer.dump(self, fields)
     
     
     # Relationship with vendor
     vendors = db.relationship("Vendor", secondary="vendor_products", back_populates="products")
     reviews = db.relationship("Review", back_populates="product", lazy=True)
     carts = db.relationship('Cart', secondary=cart_products, back_populates='products')
+    inventory_shards = db.relationship('InventoryShard', cascade='all, delete-orphan', lazy=True)
     
     
     
@@ -121,10 +209,16 @@ class Cart(db.Model, SerializerMixin):
             } if self.buyer else None,
             'products': [
                 {
-                    'id': product.id,
-                    'name': product.name,
-                    'price': product.price
-                } for product in self.products
+                    'id': product_id,
+                    'name': name,
+                    'price': price,
+                    'quantity': quantity
+                } for product_id, name, price, quantity in db.session.execute(
+                    db.select(Product.id, Product.name, Product.price, cart_products.c.quantity)
+                    .join(cart_products, cart_products.c.product_id == Product.id)
+                    .where(cart_products.c.cart_id == self.id)
+                    .order_by(Product.id)
+                )
             ]
         }
 class Order(db.Model, SerializerMixin):
@@ -138,18 +232,13 @@ class Order(db.Model, SerializerMixin):
     vendor_id = db.Column(db.Integer, db.ForeignKey('vendors.id'), nullable=False)
     total_price = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(50), nullable=False, default='Pending')
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=db.func.now())
     
     buyer = db.relationship('Buyer', back_populates='orders', lazy=True)
     vendor = db.relationship('Vendor', back_populates='orders', lazy=True)
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'buyer_id': self.buyer_id,
-            'vendor_id': self.vendor_id,
-            'total_price': self.total_price,
-            'status': self.status
-        }
+    def to_dict(self, fields=None):
+        return order_serializer.dump(self, fields)
     
     
 class Review(db.Model, SerializerMixin):
@@ -159,18 +248,164 @@ class Review(db.Model, SerializerMixin):
     serialize_rules = ('-vendor.reviews', '-product.reviews')
 
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
-    vendor_id = db.Column(db.Integer, db.ForeignKey('vendors.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendors.id'), nullable=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('buyers.id'), nullable=True)
     rating = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.String(255), nullable=True)
     
     product = db.relationship('Product', back_populates='reviews', lazy=True)
     vendor = db.relationship('Vendor', back_populates='reviews', lazy=True)
+    buyer = db.relationship('Buyer', lazy=True)
     
     
 class TokenBlocklist(db.Model):
     __tablename__ = "token_blocklist"
 
     id = db.Column(db.Integer, primary_key=True)
-    jti = db.Column(db.String(36), nullable=False)
-    created_at = db.Column(db.DateTime, nullable=False, default=db.func.now())
\ No newline at end of file
+    jti = db.Column(db.String(36), nullable=False, unique=True, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.now())
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+
+
+class VendorSalesRollup(db.Model):
+    __tablename__ = "vendor_sales_rollups"
+
+    # one row per vendor, bucket (day/week/month starting at period_start) and order status
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendors.id'), primary_key=True)
+    period = db.Column(db.String(5), primary_key=True)
+    period_start = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+
+
+class CatalogSequence(db.Model):
+    __tablename__ = "catalog_sequence"
+
+    # a single row (id 1) handing out product versions
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    # tombstones up to this version have been pruned
+    pruned_through = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
+# create_all() seeds the row; the migration does the same for existing databases
+db.event.listen(
+    CatalogSequence.__table__,
+    'after_create',
+    db.DDL("INSERT INTO catalog_sequence (id, value, pruned_through) VALUES (1, 0, 0)"),
+)
+
+
+class ProductTombstone(db.Model):
+    __tablename__ = "product_tombstones"
+
+    # left behind by a product delete so sync clients learn about it
+    product_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=db.func.now())
+
+
+class InventoryShard(db.Model):
+    __tablename__ = "inventory_shards"
+
+    # a hot product's stock split over several rows, so concurrent
+    # checkouts decrement different rows instead of queueing on one
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True)
+    stock = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Job(db.Model):
+    __tablename__ = "jobs"
+
+    # transactional outbox: a job row commits or rolls back together with
+    # the change that needs the follow-up work; jobs.JobQueue runs it later
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending', server_default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=db.func.now())
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=db.func.now())
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+class OrderEvent(db.Model):
+    __tablename__ = "order_events"
+    # streams read forward from the last id they saw, so an id must never
+    # be handed out twice, not even once pruning has emptied the table
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    # what /orders/stream pushes, committed together with the order change;
+    # every process with open streams polls it, so an event reaches them
+    # whichever process wrote it
+    id = db.Column(db.Integer, primary_key=True)
+    buyer_id = db.Column(db.Integer, nullable=True)
+    vendor_id = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=db.func.now(), index=True)
+
+
+def _rating(product):
+    return {
+        'count': product.rating_count or 0,
+        'average': round(float(product.rating_avg or 0), 2),
+        'histogram': {
+            '1': product.rating_1 or 0,
+            '2': product.rating_2 or 0,
+            '3': product.rating_3 or 0,
+            '4': product.rating_4 or 0,
+            '5': product.rating_5 or 0,
+        },
+    }
+
+
+# field plans behind to_dict() and the ?fields= projection
+product_serializer = Serializer(Product, {
+    'id': 'id',
+    'name': 'name',
+    'category': 'category',
+    'price': 'price',
+    'image_url': 'image_url',
+    'rating': (_rating, ('rating_count', 'rating_avg', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5')),
+})
+
+
+def _party(key):
+    # {"id", "username"} of a related buyer or vendor; load it with the
+    # matching loaders.py profile or this lazy-loads once per row
+    get = attrgetter(key)
+
+    def field(obj):
+        party = get(obj)
+        return {'id': party.id, 'username': party.username} if party is not None else None
+    return field
+
+
+order_serializer = Serializer(Order, {
+    'id': 'id',
+    'buyer_id': 'buyer_id',
+    'vendor_id': 'vendor_id',
+    'total_price': 'total_price',
+    'status': 'status',
+    'created_at': (isoformat('created_at'), ('created_at',)),
+})
+
+review_serializer = Serializer(Review, {
+    'id': 'id',
+    'product_id': 'product_id',
+    'rating': 'rating',
+    'comment': 'comment',
+    'buyer': (_party('buyer'), ('buyer_id',)),
+    'vendor': (_party('vendor'), ('vendor_id',)),
+})
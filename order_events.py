@@ -0,0 +1,342 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import click
+from flask import current_app, make_response
+from flask_jwt_extended import create_access_token
+from sqlalchemy import delete, event, func, or_, select
+
+from models import db, Order, OrderEvent, order_serializer, utcnow
+
+
+logger = logging.getLogger('safarivendors.order_events')
+
+# what every event (and the snapshot) says about an order
+EVENT_FIELDS = ('id', 'buyer_id', 'vendor_id', 'status')
+
+# the `scope` claim of a stream ticket; see OrderEvents.ticket()
+TICKET_SCOPE = 'order_stream'
+
+
+class Subscription:
+
+    def __init__(self, channels, queue_size):
+        self.channels = frozenset(channels)
+        self.messages = queue.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def put(self, message):
+        # never blocks the publisher; a client that stops reading is cut off
+        # and told to resync instead of buffering without bound
+        try:
+            self.messages.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalBroker:
+    # Fan-out to the streams open in this process. Every publish is a dict
+    # lookup and a put per subscriber; an idle subscriber is a queue waiting
+    # on a lock, which under gevent is a parked greenlet rather than a thread.
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)     # channel -> subscriptions
+
+    def subscribe(self, channels):
+        subscription = Subscription(channels, self.queue_size)
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscribers[channel]
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def __bool__(self):
+        return bool(self.subscribers)
+
+
+def channels_for(buyer_id=None, vendor_id=None):
+    channels = []
+    if buyer_id is not None:
+        channels.append(f'buyer:{buyer_id}')
+    if vendor_id is not None:
+        channels.append(f'vendor:{vendor_id}')
+    return channels
+
+
+class OrderEvents:
+    # Pushes order changes to /orders/stream subscribers.
+    #
+    # publish() adds a row to the `order_events` table in the caller's
+    # transaction, so an event exists exactly when the change it describes
+    # was committed, by whichever process: a web worker, or the job worker
+    # moving an order to Processing. Each process with open streams runs one
+    # poller thread that reads the rows after the last one it saw and hands
+    # them to its LocalBroker; a commit in the same process wakes it at
+    # once, other processes' events arrive within ORDER_EVENTS_POLL_INTERVAL.
+    # A process without open streams does not poll at all.
+    #
+    # An open stream holds a worker thread under gthread, so each process
+    # serves at most ORDER_STREAM_MAX_CONNECTIONS of them and answers 503
+    # past that (gunicorn.conf.py sizes it from the worker class).
+
+    def __init__(self, app=None):
+        self.broker = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.poller_pid = None
+        self.cursor = None          # last event id handed to the broker
+        self.gaps = {}              # ids below the cursor not seen yet -> first missed at
+        self.last_pruned = 0
+        self.open_streams = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ORDER_STREAM_QUEUE_SIZE', 100)
+        app.config.setdefault('ORDER_STREAM_HEARTBEAT', 15)
+        # streams end after this long and the client reconnects (EventSource
+        # does so on its own), which spreads them over the workers again
+        app.config.setdefault('ORDER_STREAM_MAX_SECONDS', 300)
+        app.config.setdefault('ORDER_STREAM_RETRY_MS', 3000)
+        app.config.setdefault('ORDER_STREAM_MAX_CONNECTIONS', 2)
+        app.config.setdefault('ORDER_STREAM_TICKET_SECONDS', 60)
+        app.config.setdefault('ORDER_EVENTS_POLL_INTERVAL', 1.0)
+        app.config.setdefault('ORDER_EVENTS_BATCH_SIZE', 500)
+        # an id skipped by the poller is looked for again this long: on
+        # Postgres a transaction can commit after a later id already has
+        app.config.setdefault('ORDER_EVENTS_GAP_SECONDS', 10)
+        app.config.setdefault('ORDER_EVENTS_RETENTION', 3600)
+        app.config.setdefault('ORDER_EVENTS_PRUNE_INTERVAL', 300)
+
+        self.broker = LocalBroker(queue_size=app.config['ORDER_STREAM_QUEUE_SIZE'])
+        self.app = app
+        app.extensions['order_events'] = self
+
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+
+        @app.cli.command('prune-order-events')
+        @click.option('--seconds', type=int, default=None, help="Keep events this many seconds.")
+        def prune_order_events_command(seconds):
+            deleted = self.prune(seconds)
+            db.session.commit()
+            print(f"Pruned {deleted} order events.")
+
+    def publish(self, kind, order, **changes):
+        # in the caller's transaction; read the order now, before the commit
+        # expires it
+        message = {'event': kind, 'order': dict(order_serializer.dump(order, EVENT_FIELDS), **changes)}
+        db.session.add(OrderEvent(buyer_id=order.buyer_id, vendor_id=order.vendor_id, payload=message))
+        db.session.info['order_events'] = True
+
+    def _after_commit(self, session):
+        if session.info.pop('order_events', False):
+            self.wakeup.set()
+
+    def _after_rollback(self, session):
+        session.info.pop('order_events', None)
+
+    def ticket(self, identity):
+        # A short-lived token that opens /orders/stream and nothing else
+        # (see app.check_token_scope). EventSource cannot set headers, so the
+        # stream takes its token from the query string, which ends up in
+        # access logs; a ticket there is worth little once it has expired.
+        return create_access_token(
+            identity=identity,
+            expires_delta=timedelta(seconds=current_app.config['ORDER_STREAM_TICKET_SECONDS']),
+            additional_claims={'scope': TICKET_SCOPE},
+        )
+
+    def _subscribe(self, channels):
+        with self.lock:
+            if self.poller_pid != os.getpid():
+                # started on first use, so each gunicorn worker gets its own
+                self.poller_pid = os.getpid()
+                self.cursor = None
+                # commits before now are not news to this process's streams
+                self.wakeup.clear()
+                threading.Thread(target=self._poll_forever, name='order-events', daemon=True).start()
+            if self.cursor is None:
+                # the first stream of an idle process: only events from now on
+                self.cursor = db.session.execute(select(func.coalesce(func.max(OrderEvent.id), 0))).scalar_one()
+                self.gaps.clear()
+            return self.broker.subscribe(channels)
+
+    def _poll_forever(self):
+        config = self.app.config
+        with self.app.app_context():
+            while True:
+                self.wakeup.wait(config['ORDER_EVENTS_POLL_INTERVAL'])
+                self.wakeup.clear()
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception("polling order events failed")
+                finally:
+                    db.session.remove()
+
+    def poll(self):
+        # hands the events committed since the last poll to this process's
+        # subscribers; returns how many there were
+        config = self.app.config
+        with self.lock:
+            if not self.broker:
+                return 0
+            cursor, gaps = self.cursor, list(self.gaps)
+
+        newer = OrderEvent.id > cursor
+        rows = db.session.execute(
+            select(OrderEvent.id, OrderEvent.buyer_id, OrderEvent.vendor_id, OrderEvent.payload)
+            .where(or_(newer, OrderEvent.id.in_(gaps)) if gaps else newer)
+            .order_by(OrderEvent.id)
+            .limit(config['ORDER_EVENTS_BATCH_SIZE'])
+        ).all()
+
+        now = time.monotonic()
+        with self.lock:
+            if self.cursor != cursor:
+                # reset meanwhile by a new first subscriber
+                return 0
+            for event_id, buyer_id, vendor_id, payload in rows:
+                if event_id > self.cursor:
+                    # a jump of more than a few ids is a reset or a prune, not a race
+                    for missed in range(self.cursor + 1, min(event_id, self.cursor + 1000)):
+                        self.gaps[missed] = now
+                    self.cursor = event_id
+                elif self.gaps.pop(event_id, None) is None:
+                    continue
+                for channel in channels_for(buyer_id, vendor_id):
+                    self.broker.publish(channel, payload)
+            for missed, since in list(self.gaps.items()):
+                if now - since > config['ORDER_EVENTS_GAP_SECONDS']:
+                    del self.gaps[missed]
+
+        if now - self.last_pruned > config['ORDER_EVENTS_PRUNE_INTERVAL']:
+            self.last_pruned = now
+            self.prune()
+            db.session.commit()
+        return len(rows)
+
+    def prune(self, seconds=None):
+        # in the caller's transaction; the caller commits
+        seconds = self.app.config['ORDER_EVENTS_RETENTION'] if seconds is None else seconds
+        cutoff = utcnow() - timedelta(seconds=seconds)
+        # the newest row stays, so no database can restart its ids below
+        # the cursors of open streams
+        newest = select(func.max(OrderEvent.id)).scalar_subquery()
+        return db.session.execute(
+            delete(OrderEvent).where(OrderEvent.created_at < cutoff, OrderEvent.id < newest)
+        ).rowcount
+
+    def _release(self, subscription):
+        with self.lock:
+            self.broker.unsubscribe(subscription)
+            self.open_streams -= 1
+            if not self.broker:
+                # nobody to tell; the next subscriber starts from its own now
+                self.cursor = None
+
+    def stream(self, buyer_id=None, vendor_id=None, snapshot=True):
+        # A text/event-stream response. The subscription starts before the
+        # snapshot is read, so nothing that commits in between is missed; at
+        # worst an order shows up in both. The generator touches neither the
+        # request nor the database, so the connection goes back to the pool
+        # when the view returns, not when the client disconnects.
+        config = current_app.config
+        heartbeat = config['ORDER_STREAM_HEARTBEAT']
+        max_seconds = config['ORDER_STREAM_MAX_SECONDS']
+        dumps = current_app.json.dumps
+
+        with self.lock:
+            if self.open_streams >= config['ORDER_STREAM_MAX_CONNECTIONS']:
+                full = True
+            else:
+                full = False
+                self.open_streams += 1
+        if full:
+            response = make_response({"message": "Too many open order streams, try again shortly!"}, 503)
+            response.headers['Retry-After'] = str(max(1, config['ORDER_STREAM_RETRY_MS'] // 1000))
+            return response
+
+        try:
+            subscription = self._subscribe(channels_for(buyer_id, vendor_id))
+        except Exception:
+            with self.lock:
+                self.open_streams -= 1
+            raise
+        try:
+            orders = None
+            if snapshot:
+                conditions = []
+                if buyer_id is not None:
+                    conditions.append(Order.buyer_id == buyer_id)
+                if vendor_id is not None:
+                    conditions.append(Order.vendor_id == vendor_id)
+                serialize = order_serializer.compile(EVENT_FIELDS)
+                orders = [
+                    serialize(order) for order in
+                    Order.query.options(*order_serializer.options(EVENT_FIELDS)).filter(or_(*conditions)).order_by(Order.id)
+                ]
+        except Exception:
+            self._release(subscription)
+            raise
+
+        def frame(kind, data):
+            return f"event: {kind}\ndata: {dumps(data)}\n\n"
+
+        def generate():
+            yield f"retry: {config['ORDER_STREAM_RETRY_MS']}\n\n"
+            if orders is not None:
+                yield frame('snapshot', orders)
+            deadline = time.monotonic() + max_seconds
+            while True:
+                if subscription.overflowed:
+                    yield frame('resync', {'message': "Too many events missed, reconnect for a new snapshot!"})
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                message = subscription.get(timeout=min(heartbeat, remaining))
+                if message is not None:
+                    yield frame(message['event'], message['order'])
+                else:
+                    # keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+
+        response = current_app.response_class(
+            generate(),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+        response.call_on_close(lambda: self._release(subscription))
+        return response
+
+
+order_events = OrderEvents()
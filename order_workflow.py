@@ -0,0 +1,76 @@
+import logging
+
+from sqlalchemy import update
+
+from analytics import move_order
+from jobs import job_queue
+from models import db, Order
+from order_events import order_events
+
+
+logger = logging.getLogger('safarivendors.orders')
+
+# status -> statuses it may move to
+TRANSITIONS = {
+    'Pending': ('Processing', 'Cancelled'),
+    'Processing': ('Completed', 'Cancelled'),
+    'Completed': (),
+    'Cancelled': (),
+}
+
+
+class OrderStatusError(ValueError):
+    pass
+
+
+def order_placed(order):
+    # queue the follow-up work for a new order, in the caller's transaction
+    job_queue.enqueue('order.placed', {'order_id': order.id})
+    order_events.publish('order.created', order)
+
+
+def change_status(order, new_status):
+    # Moves the order to new_status in the caller's transaction. The UPDATE
+    # only matches while the order still has the status it was read with,
+    # so two concurrent transitions cannot both apply.
+    old_status = order.status
+    if new_status not in TRANSITIONS:
+        raise OrderStatusError(f"status must be one of {', '.join(TRANSITIONS)}!")
+    if new_status not in TRANSITIONS.get(old_status, ()):
+        raise OrderStatusError(f"Cannot move an order from {old_status} to {new_status}!")
+
+    changed = db.session.execute(
+        update(Order)
+        .where(Order.id == order.id, Order.status == old_status)
+        .values(status=new_status)
+    ).rowcount
+    if not changed:
+        raise OrderStatusError("Order status changed meanwhile, please retry!")
+
+    move_order(order, old_status, new_status)
+    job_queue.enqueue('order.status_changed', {'order_id': order.id, 'from': old_status, 'to': new_status})
+    order_events.publish('order.status_changed', order, status=new_status, previous_status=old_status)
+
+
+def order_deleted(order):
+    # before the DELETE is flushed, while the order can still be read
+    order_events.publish('order.deleted', order)
+
+
+@job_queue.handler('order.placed')
+def process_placed_order(payload):
+    order = db.session.get(Order, payload['order_id'])
+    # deleted, or already moved on by the vendor
+    if order is None or order.status != 'Pending':
+        return
+    change_status(order, 'Processing')
+
+
+@job_queue.handler('order.status_changed')
+def notify_status_change(payload):
+    # where buyer/vendor notifications (email, push) hook in
+    order = db.session.get(Order, payload['order_id'])
+    if order is None:
+        return
+    logger.info("order %s for buyer %s / vendor %s: %s -> %s",
+                order.id, order.buyer_id, order.vendor_id, payload['from'], payload['to'])
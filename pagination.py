@@ -0,0 +1,112 @@
+import base64
+import json
+import math
+
+from sqlalchemy import tuple_
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise PaginationError("Invalid cursor!")
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError("limit must be an integer!")
+    if limit < 1:
+        raise PaginationError("limit must be positive!")
+    return min(limit, maximum)
+
+
+def parse_number(value, name):
+    # an optional numeric filter; "nan" and "inf" parse but compare with nothing
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise PaginationError(f"{name} must be a number!")
+    if not math.isfinite(number):
+        raise PaginationError(f"{name} must be a number!")
+    return number
+
+
+def parse_sort(value, columns, default='id'):
+    # "price" sorts ascending, "-price" descending
+    value = value or default
+    descending = value.startswith('-')
+    key = value.lstrip('-')
+    if key not in columns:
+        raise PaginationError(f"Cannot sort by '{key}'!")
+    return key, descending
+
+
+def is_int64(value):
+    # a JSON integer the driver can bind: not a bool, and within 64 bits
+    return isinstance(value, int) and not isinstance(value, bool) and -2 ** 63 <= value < 2 ** 63
+
+
+def _fits(value, column):
+    # whether a decoded cursor value can be compared with column: JSON gives
+    # any type, and a dict or an id of the wrong type fails in the database
+    if isinstance(value, bool):
+        return False
+    python_type = column.type.python_type
+    if python_type is float:
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    if python_type is int:
+        return is_int64(value)
+    return isinstance(value, python_type)
+
+
+def keyset_page(query, sort_key, sort_column, id_column, descending=False, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    # Seek past the last row of the previous page on (sort_column, id) so
+    # every page is an index range scan, however deep the client has paged.
+    if cursor:
+        position = decode_cursor(cursor)
+        if not isinstance(position, dict) or position.get('sort') != sort_key or 'id' not in position:
+            raise PaginationError("Cursor does not match this query!")
+        if not _fits(position.get('value'), sort_column) or not _fits(position['id'], id_column):
+            raise PaginationError("Invalid cursor!")
+
+        last = tuple_(sort_column, id_column)
+        bound = tuple_(position.get('value'), position['id'])
+        query = query.filter(last < bound if descending else last > bound)
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    # fetch one extra row to know whether another page exists
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_row = rows[-1]
+        next_cursor = encode_cursor({
+            'sort': sort_key,
+            'value': getattr(last_row, sort_column.key),
+            'id': getattr(last_row, id_column.key),
+        })
+    return rows, next_cursor
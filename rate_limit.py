@@ -0,0 +1,265 @@
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from flask import g, has_request_context, make_response, request
+from flask_jwt_extended import JWTManager, decode_token
+
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(spec):
+    # "10/minute" -> (capacity 10, refill 10 tokens per 60 seconds)
+    count, _, period = spec.partition('/')
+    if period not in PERIODS or not count.isdigit() or int(count) < 1:
+        raise ValueError(f"Invalid rate limit '{spec}', expected e.g. '10/minute'")
+    return int(count), int(count) / PERIODS[period]
+
+
+class MemoryStore:
+    # Buckets in this process only: every gunicorn worker enforces the full
+    # limit on its own. Bounded; an evicted bucket starts full again.
+
+    def __init__(self, max_size=100000):
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()    # key -> (tokens, updated)
+        self.max_size = max_size
+
+    def take(self, key, capacity, rate, cost=1):
+        # (allowed, tokens left)
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_size:
+                self.buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class SQLiteStore:
+    # Buckets in a small SQLite file next to the workers, so every gunicorn
+    # worker on the host draws from the same bucket. Each take is a single
+    # UPSERT ... RETURNING on its own connection; SQLite's write lock makes
+    # it atomic across processes. This is not the application database and
+    # nothing in it needs to survive a restart.
+
+    PRUNE_INTERVAL = 300
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.last_pruned = 0
+
+    def _connection(self):
+        # opened lazily per thread and per process, never inherited through fork
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, allowed INTEGER NOT NULL)"
+            )
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def take(self, key, capacity, rate, cost=1):
+        # time.time(), not monotonic(): the clock has to agree between processes
+        now = time.time()
+        connection = self._connection()
+        # SET expressions all see the old row, so `allowed` and `tokens`
+        # are computed from the same refilled level
+        tokens, allowed = connection.execute(
+            "INSERT INTO buckets (key, tokens, updated, allowed) VALUES (:key, :capacity - :cost, :now, 1) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "tokens = MIN(:capacity, tokens + (:now - updated) * :rate) "
+            "- CASE WHEN MIN(:capacity, tokens + (:now - updated) * :rate) >= :cost THEN :cost ELSE 0 END, "
+            "allowed = MIN(:capacity, tokens + (:now - updated) * :rate) >= :cost, "
+            "updated = :now "
+            "RETURNING tokens, allowed",
+            {'key': key, 'capacity': capacity, 'rate': rate, 'cost': cost, 'now': now},
+        ).fetchone()
+
+        if now - self.last_pruned > self.PRUNE_INTERVAL:
+            self.last_pruned = now
+            # a bucket untouched for a day is full again anyway
+            connection.execute("DELETE FROM buckets WHERE updated < ?", (now - 86400,))
+        return bool(allowed), tokens
+
+
+def create_store(url):
+    # "memory", or "sqlite:///path/to/file.db" (a shared file per host)
+    if url == 'memory':
+        return MemoryStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported RATE_LIMIT_STORAGE '{url}'")
+
+
+class RequestJWTManager(JWTManager):
+    # Decodes a token once per request. RateLimiter.caller() reads the
+    # caller from it before any view runs, and jwt_required() verifies the
+    # same token again moments later; the second decode is this dict lookup.
+    # Only successful decodes are kept, so a bad token fails the same way
+    # both times.
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        if not has_request_context():
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        decoded = request.environ.setdefault('jwt.decoded', {})
+        key = (encoded_token, csrf_value, allow_expired)
+        if key not in decoded:
+            decoded[key] = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        return decoded[key]
+
+
+def caller_of(identity):
+    # tokens from identity_for() name the user; older ones carry a buyer or
+    # vendor profile id, which must not share a bucket with the same users.id
+    if 'buyer_id' in identity or 'vendor_id' in identity:
+        return f"user:{identity['id']}"
+    return f"{identity.get('user_type')}:{identity['id']}"
+
+
+class RateLimiter:
+    # Runs before every request, ahead of authentication and any SQL, so a
+    # rejected request costs a dictionary or SQLite lookup and nothing else.
+    #
+    # Token buckets: RATE_LIMITS gives routes (by endpoint name) their own
+    # bucket per caller; every other route shares the RATE_LIMIT_DEFAULT
+    # bucket. The caller is the JWT's user when the request carries a valid
+    # token, otherwise the client IP. Over the limit -> 429.
+    #
+    # Load shedding: SHED_CONCURRENCY caps how many requests of an expensive
+    # route run at once in this process, and SHED_MAX_IN_FLIGHT caps all of
+    # them. Past either cap the request gets an immediate 503 instead of
+    # waiting for a thread, so a burst of logins (each one a password hash)
+    # cannot occupy every worker thread and starve the catalog.
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.in_flight = Counter()      # endpoint -> running requests, '*' for all
+        self.store = None
+        self.limits = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATE_LIMIT_ENABLED', True)
+        app.config.setdefault(
+            'RATE_LIMIT_STORAGE', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'safarivendors-ratelimit.db')
+        )
+        app.config.setdefault('RATE_LIMIT_DEFAULT', '300/minute')
+        app.config.setdefault('RATE_LIMITS', {
+            'login': '10/minute',
+            'register': '5/minute',
+            'bulk_products': '10/hour',
+            'checkout': '20/minute',
+            'batch': '60/minute',
+        })
+        app.config.setdefault('RATE_LIMIT_EXEMPT', ('metrics', 'static'))
+        app.config.setdefault('SHED_CONCURRENCY', {'login': 2, 'register': 2, 'bulk_products': 1})
+        app.config.setdefault('SHED_MAX_IN_FLIGHT', None)
+        app.config.setdefault('SHED_RETRY_AFTER', 1)
+        self.app = app
+        app.extensions['rate_limiter'] = self
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _configure(self):
+        # parsed on first use, so config changes after init_app still apply
+        config = self.app.config
+        self.store = create_store(config['RATE_LIMIT_STORAGE'])
+        self.default_limit = parse_rate(config['RATE_LIMIT_DEFAULT'])
+        self.limits = {endpoint: parse_rate(spec) for endpoint, spec in config['RATE_LIMITS'].items()}
+
+    @staticmethod
+    def caller():
+        # the JWT's user, else the client IP. Past jwt_required() (as in
+        # /batch) the verified claims are already on g. Before it, only the
+        # signature and expiry are checked here, and RequestJWTManager hands
+        # the decoded token on to jwt_required() for the full check.
+        claims = g.get('_jwt_extended_jwt')
+        if not claims:
+            auth = request.headers.get('Authorization', '')
+            if auth.startswith('Bearer '):
+                try:
+                    claims = decode_token(auth[len('Bearer '):])
+                except Exception:
+                    claims = None
+        identity = claims.get('sub') if claims else None
+        if isinstance(identity, dict) and 'id' in identity:
+            return caller_of(identity)
+        return f"ip:{request.remote_addr}"
+
+    @staticmethod
+    def _reject(message, status, retry_after):
+        response = make_response({"message": message}, status)
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def _before_request(self):
+        return self.check(request.endpoint, self.caller())
+
+    def check(self, endpoint, caller, count_in_flight=True):
+        # None if the request may run, else the 429 or 503 response. Also
+        # called by /batch for each of its sub-requests, with the batch's
+        # caller: a sub-request draws from the same bucket and takes the
+        # same shed slot as the request it stands for. It does not count
+        # towards SHED_MAX_IN_FLIGHT again (count_in_flight=False); the
+        # batch request already does.
+        config = self.app.config
+        if not config['RATE_LIMIT_ENABLED'] or endpoint is None or endpoint in config['RATE_LIMIT_EXEMPT']:
+            return None
+
+        if self.store is None:
+            self._configure()
+        if endpoint in self.limits:
+            capacity, rate = self.limits[endpoint]
+            key = f"{endpoint}:{caller}"
+        else:
+            capacity, rate = self.default_limit
+            key = f"*:{caller}"
+        allowed, tokens = self.store.take(key, capacity, rate)
+        if not allowed:
+            return self._reject("Too many requests, slow down!", 429, (1 - tokens) / rate)
+
+        cap = config['SHED_CONCURRENCY'].get(endpoint)
+        max_in_flight = config['SHED_MAX_IN_FLIGHT'] if count_in_flight else None
+        with self.lock:
+            if (cap is not None and self.in_flight[endpoint] >= cap) or (
+                max_in_flight is not None and self.in_flight['*'] >= max_in_flight
+            ):
+                shed = True
+            else:
+                shed = False
+                slot = (endpoint, '*') if count_in_flight else (endpoint,)
+                for name in slot:
+                    self.in_flight[name] += 1
+                # on the request, not g: batch sub-requests share the app context
+                request.environ['rate_limit.slot'] = slot
+        if shed:
+            return self._reject("Server is busy, try again shortly!", 503, config['SHED_RETRY_AFTER'])
+        return None
+
+    def _teardown_request(self, exc):
+        slot = request.environ.pop('rate_limit.slot', ())
+        if slot:
+            with self.lock:
+                for name in slot:
+                    self.in_flight[name] -= 1
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,60 @@
+from sqlalchemy import case, func, select, update
+
+from models import db, Product, Review
+
+
+STARS = (1, 2, 3, 4, 5)
+
+
+class RatingError(ValueError):
+    pass
+
+
+def validate_rating(value):
+    if isinstance(value, bool) or not isinstance(value, int) or value not in STARS:
+        raise RatingError("rating must be an integer from 1 to 5!")
+    return value
+
+
+def apply_rating_change(product_id, added=None, removed=None):
+    # Moves one review in or out of the product's rating summary with a single
+    # UPDATE. The right-hand sides read the pre-update row, so concurrent
+    # reviews of the same product never lose increments.
+    products = Product.__table__
+    count_delta = (added is not None) - (removed is not None)
+    sum_delta = (added or 0) - (removed or 0)
+
+    values = {
+        'rating_count': products.c.rating_count + count_delta,
+        'rating_sum': products.c.rating_sum + sum_delta,
+        'rating_avg': case(
+            (products.c.rating_count + count_delta > 0,
+             (products.c.rating_sum + sum_delta) * 1.0 / (products.c.rating_count + count_delta)),
+            else_=0,
+        ),
+    }
+    for star in STARS:
+        delta = (added == star) - (removed == star)
+        if delta:
+            column = products.c[f'rating_{star}']
+            values[column.key] = column + delta
+
+    db.session.execute(update(products).where(products.c.id == product_id).values(**values))
+
+
+def rebuild_ratings():
+    # recomputes every product's summary from the reviews table, for backfills
+    products = Product.__table__
+    reviews = Review.__table__
+
+    def aggregate(expression):
+        return select(expression).where(reviews.c.product_id == products.c.id).scalar_subquery()
+
+    values = {
+        'rating_count': aggregate(func.count(reviews.c.id)),
+        'rating_sum': aggregate(func.coalesce(func.sum(reviews.c.rating), 0)),
+        'rating_avg': aggregate(func.coalesce(func.avg(reviews.c.rating * 1.0), 0)),
+    }
+    for star in STARS:
+        values[f'rating_{star}'] = aggregate(func.coalesce(func.sum(case((reviews.c.rating == star, 1), else_=0)), 0))
+    db.session.execute(update(products).values(**values))
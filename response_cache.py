@@ -0,0 +1,109 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from flask import request
+
+
+class ResponseCache:
+    # LRU + TTL cache of serialized GET responses, keyed on path and query
+    # string. Each entry carries tags (e.g. "product:12") so writes can drop
+    # exactly the entries they affect in this process.
+    #
+    # The cache lives in the worker process, so other workers never see
+    # those drops. What keeps them correct is the generation: a counter in
+    # the database that every relevant write moves (the catalog version).
+    # get() reads it once per request, before the view reads any data, and
+    # an entry stored under an older generation is dropped instead of
+    # served. The same number labels what set() stores, so a response built
+    # from data read before a write can never outlive that write.
+
+    def __init__(self, app=None, generation=None):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()    # key -> (body, etag, headers, tags, stored_at, generation)
+        self.tagged = defaultdict(set)  # tag -> keys
+        self.latest = 0                 # the newest generation this process has seen
+        if app is not None:
+            self.init_app(app, generation)
+
+    def init_app(self, app, generation=None):
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 1024)
+        app.config.setdefault('RESPONSE_CACHE_TTL', 60)
+        # a function returning the current generation; None trusts the TTL
+        self.generation = generation or (lambda: 0)
+        self.app = app
+        app.extensions['response_cache'] = self
+
+    @staticmethod
+    def key():
+        return request.path, tuple(sorted(request.args.items(multi=True)))
+
+    def _drop(self, key):
+        body, etag, headers, tags, stored_at, generation = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tagged[tag]
+            keys.discard(key)
+            if not keys:
+                del self.tagged[tag]
+
+    def _respond(self, body, etag, headers):
+        response = self.app.response_class(body, status=200, mimetype='application/json', headers=headers)
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+    def get(self):
+        # a cached (possibly 304) response for the current request, or None
+        if not self.app.config['RESPONSE_CACHE_SIZE']:
+            return None
+        current = self.generation()
+        # what set() labels this request's response with
+        request.environ['response_cache.generation'] = current
+
+        key = self.key()
+        with self.lock:
+            self.latest = max(self.latest, current)
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            body, etag, headers, tags, stored_at, generation = entry
+            if generation != current or time.monotonic() - stored_at > self.app.config['RESPONSE_CACHE_TTL']:
+                self._drop(key)
+                return None
+            self.entries.move_to_end(key)
+        return self._respond(body, etag, headers)
+
+    def set(self, response, tags=()):
+        # store a 200 JSON response and return it with ETag/304 handling applied
+        body = response.get_data()
+        etag = hashlib.sha1(body).hexdigest()
+        headers = {name: value for name, value in response.headers.items() if name.startswith('X-')}
+        generation = request.environ.get('response_cache.generation')
+        key = self.key()
+        with self.lock:
+            # no get() first, or the data may predate a write already seen
+            if generation is not None and generation >= self.latest:
+                if key in self.entries:
+                    self._drop(key)
+                self.entries[key] = (body, etag, headers, frozenset(tags), time.monotonic(), generation)
+                for tag in tags:
+                    self.tagged[tag].add(key)
+                while len(self.entries) > self.app.config['RESPONSE_CACHE_SIZE']:
+                    self._drop(next(iter(self.entries)))
+        return self._respond(body, etag, headers)
+
+    def invalidate(self, *tags):
+        with self.lock:
+            for tag in tags:
+                for key in list(self.tagged.get(tag, ())):
+                    self._drop(key)
+
+    def clear(self):
+        # forgets the generation too, for a database that starts over
+        with self.lock:
+            self.entries.clear()
+            self.tagged.clear()
+            self.latest = 0
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from models import db, TokenBlocklist
+
+
+def _utc(timestamp):
+    # the blocklist stores naive UTC datetimes, like db.func.now() on SQLite
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+class RevocationCache:
+    # Answers "is this jti revoked?" from memory for the common case.
+    #
+    # Revoked JTIs are kept until their token expires, since a revocation can
+    # never be undone. JTIs found *not* revoked are remembered for `ttl`
+    # seconds only: a logout handled by another worker becomes visible here
+    # within that window. Both maps are bounded; an evicted jti just falls
+    # back to a blocklist lookup.
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.revoked = OrderedDict()    # jti -> token expiry (epoch seconds)
+        self.allowed = OrderedDict()    # jti -> time the blocklist was checked
+        self.warmed = False
+        self.last_pruned = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JWT_REVOCATION_CACHE_TTL', 30)
+        app.config.setdefault('JWT_REVOCATION_CACHE_SIZE', 100000)
+        app.config.setdefault('JWT_BLOCKLIST_PRUNE_INTERVAL', 3600)
+        self.app = app
+        app.extensions['revocation_cache'] = self
+
+        @app.cli.command('prune-token-blocklist')
+        def prune_token_blocklist():
+            deleted = self.prune()
+            print(f"Pruned {deleted} expired tokens from the blocklist.")
+
+    @property
+    def ttl(self):
+        return self.app.config['JWT_REVOCATION_CACHE_TTL']
+
+    @property
+    def max_size(self):
+        return self.app.config['JWT_REVOCATION_CACHE_SIZE']
+
+    def _remember(self, entries, jti, value):
+        entries[jti] = value
+        entries.move_to_end(jti)
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+    def warm(self):
+        # load every blocklisted token that has not expired yet
+        now = _utc(time.time())
+        rows = db.session.query(TokenBlocklist.jti, TokenBlocklist.expires_at).filter(
+            TokenBlocklist.expires_at > now
+        ).order_by(TokenBlocklist.expires_at)
+        with self.lock:
+            for jti, expires_at in rows:
+                expires = expires_at.replace(tzinfo=timezone.utc).timestamp()
+                self._remember(self.revoked, jti, expires)
+            self.warmed = True
+
+    def is_revoked(self, jti, expires=None):
+        if not self.warmed:
+            self.warm()
+
+        now = time.time()
+        with self.lock:
+            if jti in self.revoked:
+                return True
+            checked_at = self.allowed.get(jti)
+            if checked_at is not None and now - checked_at < self.ttl:
+                return False
+
+        revoked = db.session.query(TokenBlocklist.id).filter_by(jti=jti).first() is not None
+        with self.lock:
+            if revoked:
+                self._remember(self.revoked, jti, expires or float('inf'))
+            else:
+                self._remember(self.allowed, jti, now)
+        return revoked
+
+    def revoke(self, jti, expires=None):
+        # adds the blocklist row to the session, the caller commits
+        db.session.add(TokenBlocklist(jti=jti, expires_at=_utc(expires) if expires else None))
+        expires = expires or float('inf')
+        with self.lock:
+            self.allowed.pop(jti, None)
+            self._remember(self.revoked, jti, expires)
+
+    def prune(self):
+        now = time.time()
+        expired = TokenBlocklist.expires_at < _utc(now)
+        # rows written before expires_at existed are dropped once they are
+        # older than any refresh token could be
+        refresh_expires = self.app.config['JWT_REFRESH_TOKEN_EXPIRES']
+        if refresh_expires:
+            legacy_cutoff = _utc(now - refresh_expires.total_seconds())
+            expired = db.or_(
+                expired,
+                db.and_(TokenBlocklist.expires_at.is_(None), TokenBlocklist.created_at < legacy_cutoff),
+            )
+        deleted = TokenBlocklist.query.filter(expired).delete(synchronize_session=False)
+        db.session.commit()
+
+        with self.lock:
+            for jti in [jti for jti, expires in self.revoked.items() if expires < now]:
+                del self.revoked[jti]
+            self.last_pruned = now
+        return deleted
+
+    def prune_if_due(self):
+        if time.time() - self.last_pruned >= self.app.config['JWT_BLOCKLIST_PRUNE_INTERVAL']:
+            self.prune()
+
+
+revocation_cache = RevocationCache()
@@ -0,0 +1,231 @@
+import bisect
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from sqlalchemy import DDL, event, text
+
+from models import db, Product
+
+
+FTS_TABLE = 'products_fts'
+
+# name matches count for more than category matches
+NAME_WEIGHT = 2.0
+CATEGORY_WEIGHT = 1.0
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(value):
+    return TOKEN_RE.findall((value or '').lower())
+
+
+# create the FTS5 table alongside `products` whenever the schema is built with
+# create_all() on SQLite (seed.py, local setups); migrations create it otherwise
+event.listen(
+    Product.__table__,
+    'after_create',
+    DDL(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(name, category, tokenize='unicode61 remove_diacritics 2')")
+    .execute_if(dialect='sqlite'),
+)
+event.listen(
+    Product.__table__,
+    'before_drop',
+    DDL(f"DROP TABLE IF EXISTS {FTS_TABLE}").execute_if(dialect='sqlite'),
+)
+
+
+class FTS5Index:
+    # Rows live in an FTS5 virtual table keyed by the product id. Writes go
+    # through db.session, so they commit or roll back with the product change.
+
+    def upsert(self, products):
+        db.session.execute(
+            text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), [{'id': p.id} for p in products]
+        )
+        db.session.execute(
+            text(f"INSERT INTO {FTS_TABLE} (rowid, name, category) VALUES (:id, :name, :category)"),
+            [{'id': p.id, 'name': p.name, 'category': p.category or ''} for p in products],
+        )
+
+    def remove(self, product_id):
+        db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': product_id})
+
+    def search(self, query, limit, offset):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # every term must match, the last one as a prefix for search-as-you-type
+        match = ' '.join(f'"{term}"' for term in terms[:-1])
+        match = f'{match} "{terms[-1]}"*'.strip()
+        rows = db.session.execute(
+            text(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+                f"ORDER BY bm25({FTS_TABLE}, {NAME_WEIGHT}, {CATEGORY_WEIGHT}) LIMIT :limit OFFSET :offset"
+            ),
+            {'match': match, 'limit': limit, 'offset': offset},
+        )
+        return [row[0] for row in rows]
+
+    def rebuild(self):
+        db.session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        db.session.execute(text(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, category) "
+            f"SELECT id, name, COALESCE(category, '') FROM products"
+        ))
+
+
+class MemoryIndex:
+    # Inverted index held by the worker process, for databases without FTS5.
+    # Other workers do not see this process's writes, so the index is rebuilt
+    # from the products table once it is older than `max_age` seconds.
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.built_at = None
+        self._reset()
+
+    def _reset(self):
+        self.postings = defaultdict(dict)   # term -> {product_id: weighted term frequency}
+        self.lengths = {}                   # product_id -> weighted document length
+        self.terms = {}                     # product_id -> indexed terms
+        self.vocabulary = []                # sorted terms, for prefix lookups
+
+    def _add(self, product_id, name, category):
+        weights = Counter()
+        for term in tokenize(name):
+            weights[term] += NAME_WEIGHT
+        for term in tokenize(category):
+            weights[term] += CATEGORY_WEIGHT
+        for term, weight in weights.items():
+            if term not in self.postings:
+                bisect.insort(self.vocabulary, term)
+            self.postings[term][product_id] = weight
+        self.lengths[product_id] = sum(weights.values())
+        self.terms[product_id] = set(weights)
+
+    def _discard(self, product_id):
+        for term in self.terms.pop(product_id, ()):
+            postings = self.postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self.postings[term]
+                self.vocabulary.pop(bisect.bisect_left(self.vocabulary, term))
+        self.lengths.pop(product_id, None)
+
+    def _ensure_fresh(self):
+        if self.built_at is None or time.monotonic() - self.built_at > self.max_age:
+            self.rebuild()
+
+    def upsert(self, products):
+        with self.lock:
+            for product in products:
+                self._discard(product.id)
+                self._add(product.id, product.name, product.category)
+
+    def remove(self, product_id):
+        with self.lock:
+            self._discard(product_id)
+
+    def _matching(self, term, prefix):
+        if not prefix:
+            return self.postings.get(term, {})
+        matches = {}
+        start = bisect.bisect_left(self.vocabulary, term)
+        for candidate in self.vocabulary[start:]:
+            if not candidate.startswith(term):
+                break
+            for product_id, weight in self.postings[candidate].items():
+                matches[product_id] = max(weight, matches.get(product_id, 0))
+        return matches
+
+    def search(self, query, limit, offset):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self._ensure_fresh()
+
+        with self.lock:
+            total = len(self.lengths)
+            average_length = (sum(self.lengths.values()) / total) if total else 0
+            scores = None
+            for i, term in enumerate(terms):
+                matches = self._matching(term, prefix=(i == len(terms) - 1))
+                idf = math.log(1 + (total - len(matches) + 0.5) / (len(matches) + 0.5))
+                term_scores = {}
+                for product_id, tf in matches.items():
+                    if scores is not None and product_id not in scores:
+                        continue
+                    # BM25 with k1=1.2, b=0.75
+                    norm = tf + 1.2 * (0.25 + 0.75 * self.lengths[product_id] / average_length)
+                    term_scores[product_id] = (scores or {}).get(product_id, 0) + idf * tf * 2.2 / norm
+                scores = term_scores
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [product_id for product_id, _ in ranked[offset:offset + limit]]
+
+    def rebuild(self):
+        rows = db.session.query(Product.id, Product.name, Product.category).yield_per(1000)
+        with self.lock:
+            self._reset()
+            for product_id, name, category in rows:
+                self._add(product_id, name, category)
+            self.built_at = time.monotonic()
+
+
+class ProductSearch:
+
+    def __init__(self, app=None):
+        self.indexes = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['product_search'] = self
+
+        @app.cli.command('rebuild-search-index')
+        def rebuild_search_index():
+            self.rebuild()
+            db.session.commit()
+            print("Search index rebuilt.")
+
+    @property
+    def index(self):
+        engine = db.engine
+        index = self.indexes.get(engine)
+        if index is None:
+            index = self._detect(engine)
+            self.indexes[engine] = index
+        return index
+
+    def _detect(self, engine):
+        if engine.dialect.name == 'sqlite':
+            exists = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE},
+            ).first()
+            if exists:
+                return FTS5Index()
+        return MemoryIndex()
+
+    def upsert(self, *products):
+        if products:
+            self.index.upsert(products)
+
+    def remove(self, product_id):
+        self.index.remove(product_id)
+
+    def search(self, query, limit, offset=0):
+        return self.index.search(query, limit, offset)
+
+    def rebuild(self):
+        self.index.rebuild()
+
+
+product_search = ProductSearch()
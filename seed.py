@@ -1,48 +1,200 @@
+import argparse
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from sqlalchemy import insert, update
+
+from accounts import hash_password
 from app import app
-from models import  *
-
-with app.app_context():
-    print("Populating the table")
-    
-    
-    db.drop_all()
-    db.create_all()
-    
-    buyer1 = Buyer(username='john_doe', email='john@example.com', password='password123')
-    buyer2 = Buyer(username='jane_doe', email='jane@example.com', password='securepass456')
-    
-    # Seed Vendors
-    vendor1 = Vendor(username='vendor_one', email='vendor1@example.com', password='vendorpass1')
-    vendor2 = Vendor(username='vendor_two', email='vendor2@example.com', password='vendorpass2')
-
-    # Seed Products
-    product1 = Product(name='Coffee Mug', category='Home & Kitchen', price=12.99, image_url='http://example.com/mug.jpg')
-    product2 = Product(name='T-Shirt', category='Clothing', price=19.99, image_url='http://example.com/shirt.jpg')
-    product3 = Product(name='Smartphone', category='Electronics', price=499.99, image_url='http://example.com/phone.jpg')
-    
-    # Assign products to vendors (many-to-many relationship)
-    vendor1.products.extend([product1, product2])
-    vendor2.products.append(product3)
-    
-    # Seed Cart
-    cart1 = Cart(buyer=buyer1, products=[product1, product3])
-    cart2 = Cart(buyer=buyer2, products=[product2])
-    
-    # Seed Orders
-    order1 = Order(buyer=buyer1, vendor=vendor1, total_price=32.98, status='Completed')
-    order2 = Order(buyer=buyer2, vendor=vendor2, total_price=499.99, status='Pending')
-
-    # Seed Reviews
-    review1 = Review(product=product1, vendor=vendor1, rating=5, comment="Great quality mug!")
-    review2 = Review(product=product2, vendor=vendor1, rating=4, comment="Nice T-shirt!")
-    review3 = Review(product=product3, vendor=vendor2, rating=3, comment="Phone is good, but a bit expensive.")
-
-    # Add seeded data to the session
-    db.session.add_all([buyer1, buyer2, vendor1, vendor2, product1, product2, product3, cart1, cart2, order1, order2, review1, review2, review3])
-
-    # Commit the session to save everything to the database
+from models import *
+
+
+CATEGORIES = [
+    'Fruits', 'Vegetables', 'Grains', 'Dairy', 'Meat', 'Fish', 'Spices', 'Beverages', 'Snacks', 'Bakery',
+    'Honey', 'Nuts', 'Oils', 'Tea', 'Coffee', 'Herbs', 'Legumes', 'Tubers', 'Sauces', 'Preserves',
+    'Eggs', 'Poultry', 'Flour', 'Sugar', 'Rice', 'Maize', 'Millet', 'Sorghum', 'Cassava', 'Bananas',
+]
+ADJECTIVES = ['Fresh', 'Organic', 'Local', 'Dried', 'Smoked', 'Roasted', 'Wild', 'Farm', 'Premium', 'Ripe']
+STATUSES = ['Completed', 'Pending', 'Processing', 'Cancelled']
+STATUS_WEIGHTS = [70, 15, 10, 5]
+# reviews lean positive, as they do in practice
+RATING_WEIGHTS = [7, 8, 15, 30, 40]
+
+
+def count(value):
+    # accepts "1e6" as well as "1000000"
+    return int(float(value))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Populate the database with deterministic synthetic data.")
+    parser.add_argument('--buyers', type=count, default=50)
+    parser.add_argument('--vendors', type=count, default=10)
+    parser.add_argument('--products', type=count, default=500)
+    parser.add_argument('--reviews', type=count, default=2000)
+    parser.add_argument('--orders', type=count, default=500)
+    parser.add_argument('--cart-ratio', type=float, default=0.5, help="share of buyers with a cart")
+    parser.add_argument('--seed', type=int, default=8, help="same seed, same data")
+    parser.add_argument('--chunk-size', type=count, default=5000, help="rows per insert transaction")
+    parser.add_argument('--password', default='password123', help="password for every generated user")
+    args = parser.parse_args()
+    # every product is sold by someone
+    if args.products and not args.vendors:
+        parser.error("--products needs at least one vendor")
+    return args
+
+
+def zipf_sampler(rng, population, exponent=1.1):
+    # Skewed picks from `population`: a handful of items get most of the
+    # traffic. The popular items are spread over the id range by a shuffle.
+    ranked = list(population)
+    rng.shuffle(ranked)
+    cumulative = list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, len(ranked) + 1)))
+
+    def sample():
+        return rng.choices(ranked, cum_weights=cumulative)[0]
+    return sample
+
+
+def load(table, rows, chunk_size):
+    # chunked core inserts, one transaction per chunk
+    total = 0
+    started = time.monotonic()
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        db.session.execute(insert(table), chunk)
+        db.session.commit()
+        total += len(chunk)
+    print(f"  {table.name}: {total} rows in {time.monotonic() - started:.1f}s")
+
+
+def seed(args):
+    rng = random.Random(args.seed)
+    # hashing is deliberately slow, so every user shares one hash
+    password = hash_password(args.password)
+    now = utcnow()
+
+    load(Buyer.__table__, (
+        {'id': i, 'username': f'buyer_{i}', 'email': f'buyer{i}@example.com', 'password': password}
+        for i in range(1, args.buyers + 1)
+    ), args.chunk_size)
+
+    load(Vendor.__table__, (
+        {'id': i, 'username': f'vendor_{i}', 'email': f'vendor{i}@example.com', 'password': password}
+        for i in range(1, args.vendors + 1)
+    ), args.chunk_size)
+
+    # one login per profile; users log in with their buyer/vendor email
+    load(User.__table__, itertools.chain(
+        ({'username': f'buyer_{i}', 'email': f'buyer{i}@example.com', 'password': password, 'buyer_id': i, 'vendor_id': None}
+         for i in range(1, args.buyers + 1)),
+        ({'username': f'vendor_{i}', 'email': f'vendor{i}@example.com', 'password': password, 'buyer_id': None, 'vendor_id': i}
+         for i in range(1, args.vendors + 1)),
+    ), args.chunk_size)
+
+    pick_category = zipf_sampler(rng, CATEGORIES)
+    pick_vendor = zipf_sampler(rng, range(1, args.vendors + 1))
+    vendor_of = [None] + [pick_vendor() for _ in range(args.products)]
+
+    def products():
+        for i in range(1, args.products + 1):
+            category = pick_category()
+            yield {
+                'id': i,
+                'name': f'{rng.choice(ADJECTIVES)} {category.lower()} #{i}',
+                'category': category,
+                'price': round(rng.lognormvariate(2.5, 1.0), 2),
+                'image_url': f'https://example.com/images/{i}.jpg',
+                'version': i,
+            }
+    load(Product.__table__, products(), args.chunk_size)
+    load(vendor_products, ({'vendor_id': vendor_of[i], 'product_id': i} for i in range(1, args.products + 1)), args.chunk_size)
+
+    pick_product = zipf_sampler(rng, range(1, args.products + 1))
+    summaries = {}
+
+    def reviews():
+        for i in range(1, args.reviews + 1):
+            product_id = pick_product()
+            rating = rng.choices(range(1, 6), RATING_WEIGHTS)[0]
+            summary = summaries.setdefault(product_id, [0] * 6)
+            summary[0] += 1
+            summary[rating] += 1
+            yield {
+                'id': i,
+                'product_id': product_id,
+                'vendor_id': vendor_of[product_id],
+                'buyer_id': rng.randint(1, args.buyers),
+                'rating': rating,
+                'comment': rng.choice(['Great quality!', 'Good value.', 'As described.', 'Could be fresher.', None]),
+            }
+    if args.buyers and args.products:
+        load(Review.__table__, reviews(), args.chunk_size)
+
+    # the rating summaries were tallied while generating the reviews
+    rows = []
+    for product_id, summary in summaries.items():
+        total = sum(star * summary[star] for star in range(1, 6))
+        rows.append({
+            'id': product_id,
+            'rating_count': summary[0],
+            'rating_sum': total,
+            'rating_avg': total / summary[0],
+            'version': product_id,
+            **{f'rating_{star}': summary[star] for star in range(1, 6)},
+        })
+    for offset in range(0, len(rows), args.chunk_size):
+        db.session.execute(update(Product), rows[offset:offset + args.chunk_size])
+        db.session.commit()
+
+    pick_buyer = zipf_sampler(rng, range(1, args.buyers + 1))
+
+    def orders():
+        for i in range(1, args.orders + 1):
+            yield {
+                'id': i,
+                'buyer_id': pick_buyer(),
+                'vendor_id': pick_vendor(),
+                'total_price': round(rng.lognormvariate(3.5, 1.0), 2),
+                'status': rng.choices(STATUSES, STATUS_WEIGHTS)[0],
+                'created_at': now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600)),
+            }
+    if args.buyers and args.vendors:
+        load(Order.__table__, orders(), args.chunk_size)
+
+    cart_owners = sorted(rng.sample(range(1, args.buyers + 1), int(args.buyers * args.cart_ratio)))
+    load(Cart.__table__, ({'id': i, 'buyer_id': buyer_id} for i, buyer_id in enumerate(cart_owners, start=1)), args.chunk_size)
+
+    def cart_items():
+        for cart_id in range(1, len(cart_owners) + 1):
+            for product_id in {pick_product() for _ in range(rng.randint(1, 5))}:
+                yield {'cart_id': cart_id, 'product_id': product_id, 'quantity': rng.randint(1, 3)}
+    if args.products:
+        load(cart_products, cart_items(), args.chunk_size)
+
+    # derived data
+    db.session.execute(update(CatalogSequence).where(CatalogSequence.id == 1).values(value=args.products))
+    from analytics import rebuild_rollups
+    from search import product_search
+    rebuild_rollups()
+    product_search.rebuild()
     db.session.commit()
-    
-    
 
-    print("Database has been seeded successfully!")
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    with app.app_context():
+        print("Populating the table")
+
+        db.drop_all()
+        db.create_all()
+
+        started = time.monotonic()
+        seed(args)
+
+        print(f"Database has been seeded successfully in {time.monotonic() - started:.1f}s!")
@@ -0,0 +1,141 @@
+from operator import attrgetter
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.orm import load_only
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# distinct ?fields= selections compiled per model before falling back to
+# compiling on every call
+MAX_PLANS = 256
+
+
+class FieldError(ValueError):
+    pass
+
+
+class Serializer:
+    # A field plan for one model, compiled once into a function that builds
+    # the dict from precomputed attribute getters, instead of reflecting over
+    # the model and its relationships on every row like SerializerMixin.
+    #
+    # `fields` maps output names to an attribute name, or to a
+    # (function, attribute names) pair for computed values. The attribute
+    # names are what load_only() narrows the SELECT to.
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = {}
+        for name, spec in fields.items():
+            if isinstance(spec, str):
+                self.fields[name] = (None, (spec,))
+            else:
+                function, columns = spec
+                self.fields[name] = (function, tuple(columns))
+        self.plans = {}
+
+    def parse(self, value):
+        # "id,name,price" -> ('id', 'name', 'price'); None selects every field
+        if not value:
+            return None
+        names = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise FieldError(f"Unknown field(s): {', '.join(unknown)}! Choose from {', '.join(self.fields)}.")
+        return names or None
+
+    def _compile(self, names):
+        # One attrgetter reads every plain attribute in a single C-level call
+        # (a tuple, zipped with the output names); computed fields are
+        # called after it. No per-row lookup of the plan itself.
+        plain = tuple(name for name in names if self.fields[name][0] is None)
+        computed = tuple((name, self.fields[name][0]) for name in names if self.fields[name][0] is not None)
+
+        if len(plain) == 1:
+            get_one = attrgetter(self.fields[plain[0]][1][0])
+
+            def read(obj):
+                return (get_one(obj),)
+        elif plain:
+            read = attrgetter(*(self.fields[name][1][0] for name in plain))
+        else:
+            def read(obj):
+                return ()
+
+        def dump(obj):
+            data = dict(zip(plain, read(obj)))
+            for name, function in computed:
+                data[name] = function(obj)
+            return data
+        return dump
+
+    def compile(self, names=None):
+        # the dump function for a field selection from parse()
+        names = names or tuple(self.fields)
+        dump = self.plans.get(names)
+        if dump is None:
+            dump = self._compile(names)
+            if len(self.plans) < MAX_PLANS:
+                self.plans[names] = dump
+        return dump
+
+    def dump(self, obj, names=None):
+        return self.compile(names)(obj)
+
+    def options(self, names=None, *extra):
+        # loader options selecting only the columns the fields read, plus
+        # any `extra` columns the query itself needs (sort keys, cursors)
+        if names is None:
+            return ()
+        keys = dict.fromkeys(key for name in names for key in self.fields[name][1])
+        keys.update(dict.fromkeys(column.key for column in extra))
+        return (load_only(*(getattr(self.model, key) for key in keys)),)
+
+
+def isoformat(key):
+    get = attrgetter(key)
+
+    def field(obj):
+        value = get(obj)
+        return value.isoformat() if value else None
+    return field
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # orjson behind app.json, so jsonify(), make_response(dict) and the
+    # streaming endpoints all encode with it. Output matches the stdlib
+    # provider: sorted keys, HTTP dates for datetimes, indented in debug.
+    # Decoding stays on the stdlib: orjson reads integers beyond 64 bits
+    # as floats, which would slip past the int checks on request bodies.
+
+    def _options(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def _encode(self, obj, indent=False):
+        return orjson.dumps(obj, default=self.default, option=self._options(indent))
+
+    def dumps(self, obj, **kwargs):
+        return self._encode(obj, indent=bool(kwargs.get('indent'))).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self._encode(obj, indent=pretty) + b'\n', mimetype=self.mimetype)
+
+
+def configure_json(app):
+    # JSON_BACKEND=json keeps the stdlib encoder; orjson is optional
+    backend = app.config.setdefault('JSON_BACKEND', 'orjson' if orjson else 'json')
+    if backend == 'orjson':
+        if orjson is None:
+            raise RuntimeError("JSON_BACKEND is 'orjson' but orjson is not installed")
+        app.json = FastJSONProvider(app)
@@ -0,0 +1,47 @@
+from flask import current_app, request, stream_with_context
+
+
+NDJSON = 'application/x-ndjson'
+
+# rows fetched per round trip, and serialized rows per chunk written out
+STREAM_BATCH_SIZE = 500
+
+
+def wants_stream():
+    # opt in with ?stream=1 (JSON array) or an Accept header preferring NDJSON
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+
+def stream_response(query, serialize, batch_size=STREAM_BATCH_SIZE):
+    # Writes the query result out as it is read, `batch_size` rows at a time,
+    # so memory stays flat however many rows match.
+    ndjson = request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+    dumps = current_app.json.dumps
+
+    def generate():
+        chunk = []
+        first = True
+        if not ndjson:
+            yield '['
+        for row in query.yield_per(batch_size):
+            item = dumps(serialize(row))
+            if ndjson:
+                chunk.append(item + '\n')
+            else:
+                chunk.append(item if first else ',' + item)
+            first = False
+            if len(chunk) >= batch_size:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+        if not ndjson:
+            yield ']'
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        status=200,
+        mimetype=NDJSON if ndjson else 'application/json',
+    )
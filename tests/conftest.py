@@ -0,0 +1,187 @@
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# before app.py reads them
+DATABASE = os.path.join(tempfile.mkdtemp(prefix='safarivendors-tests-'), 'test.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DATABASE}'
+os.environ['JWT_SECRET_KEY'] = 'test-secret-key-that-is-long-enough'
+os.environ['RATE_LIMIT_STORAGE'] = 'memory'
+os.environ.pop('SQLALCHEMY_REPLICA_URI', None)
+
+
+class QueryCounter:
+    # Every statement sent to any engine while active, including the ones a
+    # streamed response body runs after the view has returned.
+
+    def __init__(self):
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, 'before_cursor_execute', self._record)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app
+
+    app.config.update(
+        TESTING=True,
+        RATE_LIMIT_ENABLED=False,
+        # every request must reach the database to be measured
+        RESPONSE_CACHE_SIZE=0,
+        # a single round is enough to measure the hashing path
+        PASSWORD_HASH_METHOD='pbkdf2:sha256:1',
+        # the event stream ends right after its snapshot
+        ORDER_STREAM_MAX_SECONDS=0,
+    )
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def count_queries():
+    @contextmanager
+    def counting():
+        with QueryCounter() as counter:
+            yield counter
+    return counting
+
+
+def _token(user):
+    import accounts
+    from flask_jwt_extended import create_access_token, decode_token
+    from revocation import revocation_cache
+
+    token = create_access_token(identity=accounts.identity_for(user))
+    # the first sight of a jti costs a blocklist lookup; take it here
+    revocation_cache.is_revoked(decode_token(token)['jti'])
+    return {'Authorization': f'Bearer {token}'}
+
+
+def build_world(app, scale):
+    # A fresh database where every table the routes read has `scale` rows
+    # per parent: products, the buyer's orders, cart lines, reviews of
+    # product 1, other users, tombstones and revoked tokens.
+    import accounts
+    from analytics import rebuild_rollups
+    from models import (
+        db, Cart, Order, Product, ProductTombstone, Review, TokenBlocklist, User, Buyer, Vendor,
+        cart_products, utcnow, vendor_products,
+    )
+    from ratings import rebuild_ratings
+    from response_cache import response_cache
+    from revocation import revocation_cache
+    from search import product_search
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        response_cache.clear()
+        # measure logout with its once-an-interval blocklist prune every time
+        revocation_cache.last_pruned = 0
+
+        buyer = accounts.register('buyer', 'buyer@example.com', 'password', 'buyer')
+        vendor = accounts.register('vendor', 'vendor@example.com', 'password', 'vendor')
+        both = accounts.register('both', 'both@example.com', 'password', 'both')
+        db.session.flush()
+        for number in range(scale):
+            db.session.add(User(
+                username=f'user{number}', email=f'user{number}@example.com', password=buyer.password,
+                buyer=Buyer(username=f'user{number}', email=f'user{number}@example.com'),
+                vendor=Vendor(username=f'user{number}', email=f'user{number}@example.com'),
+            ))
+        db.session.flush()
+        other_buyers = [user.buyer_id for user in User.query.filter(User.username.like('user%'))]
+
+        products = [
+            Product(name=f'Product {number}', price=10 + number, category='Fruit' if number % 2 else 'Grain',
+                    image_url=f'https://example.com/{number}.png', stock=100)
+            for number in range(scale)
+        ]
+        db.session.add_all(products)
+        db.session.flush()
+        db.session.execute(vendor_products.insert(), [
+            {'vendor_id': vendor.vendor_id, 'product_id': product.id, 'stock': 100} for product in products
+        ])
+        db.session.execute(vendor_products.insert(), [
+            {'vendor_id': both.vendor_id, 'product_id': product.id, 'stock': None} for product in products
+        ])
+
+        cart = Cart(buyer_id=buyer.buyer_id)
+        db.session.add(cart)
+        db.session.flush()
+        db.session.execute(cart_products.insert(), [
+            {'cart_id': cart.id, 'product_id': product.id, 'quantity': 1} for product in products
+        ])
+
+        db.session.add_all([
+            Order(buyer_id=buyer.buyer_id, vendor_id=vendor.vendor_id, total_price=10 + number)
+            for number in range(scale)
+        ])
+        db.session.add(Review(rating=4, comment='Good', product_id=products[0].id,
+                              vendor_id=vendor.vendor_id, buyer_id=buyer.buyer_id))
+        db.session.add_all([
+            Review(rating=1 + number % 5, comment=f'Review {number}', product_id=products[0].id,
+                   vendor_id=vendor.vendor_id, buyer_id=buyer_id)
+            for number, buyer_id in enumerate(other_buyers)
+        ])
+        db.session.add_all([
+            ProductTombstone(product_id=100000 + number, version=0, deleted_at=utcnow()) for number in range(scale)
+        ])
+        db.session.add_all([
+            TokenBlocklist(jti=f'revoked-{number}', created_at=utcnow(), expires_at=utcnow())
+            for number in range(scale)
+        ])
+        db.session.flush()
+        rebuild_rollups()
+        rebuild_ratings()
+        db.session.commit()
+        product_search.rebuild()
+        db.session.commit()
+
+        world = SimpleNamespace(
+            scale=scale,
+            product_id=products[0].id,
+            other_product_id=products[-1].id,
+            order_id=Order.query.filter_by(buyer_id=buyer.buyer_id).order_by(Order.id).first().id,
+            review_id=Review.query.filter_by(buyer_id=buyer.buyer_id).first().id,
+            buyer_id=buyer.buyer_id,
+            vendor_id=vendor.vendor_id,
+            other_buyer_id=other_buyers[0],
+            buyer=_token(buyer),
+            vendor=_token(vendor),
+            both=_token(both),
+        )
+        db.session.remove()
+    return world
+
+
+@pytest.fixture
+def make_world(app):
+    return lambda scale: build_world(app, scale)
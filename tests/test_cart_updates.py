@@ -0,0 +1,102 @@
+import pytest
+from sqlalchemy import select
+
+
+SCALE = 4
+
+
+@pytest.fixture
+def world(make_world):
+    # the buyer's cart holds every product once
+    return make_world(SCALE)
+
+
+def _cart(app):
+    from models import db, Cart, cart_products
+
+    with app.app_context():
+        cart_id = Cart.query.one().id
+        rows = db.session.execute(
+            select(cart_products.c.product_id, cart_products.c.quantity).where(cart_products.c.cart_id == cart_id)
+        ).all()
+        db.session.remove()
+    return dict(rows)
+
+
+def _patch(client, world, body):
+    response = client.patch('/cart', headers=world.buyer, json=body)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.json
+
+
+def _product_ids(app):
+    from models import Product
+
+    with app.app_context():
+        return [product.id for product in Product.query.order_by(Product.id)]
+
+
+def test_set_add_and_remove(app, client, world):
+    first, second, third, fourth = _product_ids(app)
+    _patch(client, world, {
+        'set': [{'product_id': first, 'quantity': 5}, {'product_id': second, 'quantity': 0}],
+        'add': [{'product_id': third, 'quantity': 2}, {'product_id': first, 'quantity': 1}],
+        'remove': [fourth],
+    })
+    # set before add, and quantity 0 removes
+    assert _cart(app) == {first: 6, third: 3}
+
+
+def test_replace_keeps_quantities_of_products_that_stay(app, client, world):
+    first, second, third, fourth = _product_ids(app)
+    _patch(client, world, {'set': [{'product_id': second, 'quantity': 4}]})
+
+    _patch(client, world, {'product_ids': [second, third]})
+    assert _cart(app) == {second: 4, third: 1}
+
+    # products new to the cart start at one, then the other changes apply
+    _patch(client, world, {'product_ids': [first, second], 'add': [{'product_id': first, 'quantity': 2}]})
+    assert _cart(app) == {first: 3, second: 4}
+
+    _patch(client, world, {'product_ids': []})
+    assert _cart(app) == {}
+
+
+def test_unknown_products_are_reported_not_added(app, client, world):
+    first = _product_ids(app)[0]
+    body = _patch(client, world, {'add': [{'product_id': 999999, 'quantity': 1}], 'remove': [first, 888888]})
+    assert body['missing_product_ids'] == [888888, 999999]
+    assert 999999 not in _cart(app)
+    assert first not in _cart(app)
+
+
+def test_only_changed_rows_are_written(app, client, world, count_queries):
+    first, second, third, fourth = _product_ids(app)
+    unchanged = {'set': [{'product_id': first, 'quantity': 1}], 'product_ids': [first, second, third, fourth]}
+    with count_queries() as counter:
+        _patch(client, world, unchanged)
+    writes = [statement for statement in counter.statements if statement.split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+    # the replace always runs its one DELETE of what is not kept
+    assert len(writes) == 1 and writes[0].startswith('DELETE')
+
+    with count_queries() as counter:
+        _patch(client, world, {'set': [{'product_id': first, 'quantity': 1}, {'product_id': second, 'quantity': 7}]})
+    writes = [statement for statement in counter.statements if statement.split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+    assert len(writes) == 1 and writes[0].startswith('UPDATE')
+    assert _cart(app) == {first: 1, second: 7, third: 1, fourth: 1}
+
+
+@pytest.mark.parametrize('body', [
+    {'add': [{'product_id': '1', 'quantity': 1}]},
+    {'add': [{'product_id': 1, 'quantity': 0}]},
+    {'set': [{'product_id': 1, 'quantity': -1}]},
+    {'set': [{'product_id': 1, 'quantity': True}]},
+    {'remove': 1},
+    {'product_ids': 'all'},
+    {'add': [1]},
+])
+def test_invalid_changes_are_a_400_and_change_nothing(app, client, world, body):
+    before = _cart(app)
+    response = client.patch('/cart', headers=world.buyer, json=body)
+    assert response.status_code == 400
+    assert _cart(app) == before
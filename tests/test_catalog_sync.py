@@ -0,0 +1,98 @@
+import pytest
+
+from pagination import encode_cursor
+
+
+SCALE = 5
+
+
+def _sync(client, world, since=None, limit=200):
+    # every change after `since`, following the cursor while has_more
+    changes = []
+    while True:
+        url = f'/products/changes?limit={limit}' + (f'&since={since}' if since else '')
+        response = client.get(url, headers=world.buyer)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        changes.extend(response.json['changes'])
+        since = response.json['cursor']
+        if not response.json['has_more']:
+            return changes, since
+
+
+def _key(change):
+    return change['version'], change['product']['id'] if change['op'] == 'upsert' else change['product_id']
+
+
+def test_changes_come_in_version_order_with_tombstones(client, make_world):
+    world = make_world(SCALE)
+    initial, cursor = _sync(client, world)
+    assert [_key(change) for change in initial] == sorted(_key(change) for change in initial)
+
+    # an update, a delete, then another update of the first product
+    assert client.patch(f'/products/{world.product_id}', headers=world.vendor, json={'price': 50}).status_code == 200
+    assert client.delete(f'/products/{world.other_product_id}', headers=world.vendor).status_code == 200
+    assert client.patch(f'/products/{world.product_id}', headers=world.vendor, json={'price': 60}).status_code == 200
+
+    changes, cursor = _sync(client, world, cursor)
+    # a product written twice shows up once, at its newest version, after
+    # the delete that happened in between
+    assert [(change['op'], change.get('product_id') or change['product']['id']) for change in changes] == [
+        ('delete', world.other_product_id), ('upsert', world.product_id),
+    ]
+    assert changes[0]['version'] < changes[1]['version']
+    assert changes[1]['product']['price'] == 60
+
+    # nothing is repeated once the client has caught up
+    assert _sync(client, world, cursor)[0] == []
+
+
+def test_small_pages_miss_nothing(client, make_world):
+    world = make_world(SCALE)
+    for number in range(3):
+        client.patch(f'/products/{world.product_id}', headers=world.vendor, json={'price': 70 + number})
+    client.delete(f'/products/{world.other_product_id}', headers=world.vendor)
+
+    everything, _ = _sync(client, world)
+    assert _sync(client, world, limit=1)[0] == everything
+    assert _sync(client, world, limit=2)[0] == everything
+    # the world's tombstones plus a delete and every product but the deleted one
+    assert sum(change['op'] == 'delete' for change in everything) == SCALE + 1
+    assert sum(change['op'] == 'upsert' for change in everything) == SCALE - 1
+
+
+def test_inventory_changes_do_not_move_the_catalog(client, make_world):
+    world = make_world(SCALE)
+    _, cursor = _sync(client, world)
+    response = client.patch(f'/products/{world.product_id}/inventory', headers=world.vendor,
+                            json={'stock': 7, 'shards': 2})
+    assert response.status_code == 200
+    client.patch(f'/products/{world.product_id}/inventory', headers=world.vendor, json={'adjust': -1})
+    assert _sync(client, world, cursor)[0] == []
+
+
+def test_pruned_history_asks_for_a_full_sync(app, client, make_world):
+    from catalog_sync import prune_tombstones
+    from models import db
+
+    world = make_world(SCALE)
+    client.delete(f'/products/{world.other_product_id}', headers=world.vendor)
+    with app.app_context():
+        assert prune_tombstones(older_than_days=-1) == SCALE + 1
+        db.session.commit()
+
+    old = encode_cursor({'version': 0, 'id': 0})
+    assert client.get(f'/products/changes?since={old}', headers=world.buyer).status_code == 410
+
+
+@pytest.mark.parametrize('position', [
+    {'version': 2 ** 70, 'id': 1},
+    {'version': 1, 'id': -2 ** 64},
+    {'version': True, 'id': True},
+    {'version': 1.5, 'id': 1},
+    {'version': 1},
+    [1, 1],
+])
+def test_tampered_since_is_a_400(client, make_world, position):
+    world = make_world(2)
+    response = client.get(f'/products/changes?since={encode_cursor(position)}', headers=world.buyer)
+    assert response.status_code == 400, response.get_data(as_text=True)
@@ -0,0 +1,145 @@
+import pytest
+from sqlalchemy import select, update
+
+
+SCALE = 3
+
+
+@pytest.fixture
+def world(make_world):
+    # every product has stock 100, the vendor 100 of each, and the buyer's
+    # cart holds every product once
+    return make_world(SCALE)
+
+
+def _scalar(app, statement):
+    from models import db
+
+    with app.app_context():
+        try:
+            return db.session.execute(statement).scalar()
+        finally:
+            db.session.remove()
+
+
+def _write(app, statement):
+    from models import db
+
+    with app.app_context():
+        db.session.execute(statement)
+        db.session.commit()
+        db.session.remove()
+
+
+def _stock(client, world, product_id):
+    return client.get(f'/products/{product_id}/inventory', headers=world.buyer).json
+
+
+def _order_count(app):
+    from models import db, Order
+
+    return _scalar(app, select(db.func.count()).select_from(Order))
+
+
+def _set_cart(client, world, quantities):
+    response = client.patch('/cart', headers=world.buyer, json={
+        'product_ids': list(quantities),
+        'set': [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()],
+    })
+    assert response.status_code == 200
+
+
+def test_checkout_takes_stock(client, world):
+    _set_cart(client, world, {world.product_id: 3})
+    assert client.post('/checkout', headers=world.buyer).status_code == 201
+
+    levels = _stock(client, world, world.product_id)
+    assert levels['stock'] == 97
+    assert levels['vendors'][0] == {'vendor_id': world.vendor_id, 'stock': 97}
+
+
+def test_checkout_never_oversells_the_product(app, client, world):
+    client.patch(f'/products/{world.product_id}/inventory', headers=world.vendor, json={'stock': 2})
+    orders = _order_count(app)
+    _set_cart(client, world, {world.product_id: 3, world.other_product_id: 1})
+
+    response = client.post('/checkout', headers=world.buyer)
+    assert response.status_code == 409
+    assert response.json['out_of_stock'] == [world.product_id]
+    # nothing was taken, ordered or emptied
+    assert _stock(client, world, world.product_id)['stock'] == 2
+    assert _stock(client, world, world.other_product_id)['stock'] == 100
+    assert _order_count(app) == orders
+    assert client.get('/cart', headers=world.buyer).json
+
+    _set_cart(client, world, {world.product_id: 2})
+    assert client.post('/checkout', headers=world.buyer).status_code == 201
+    assert _stock(client, world, world.product_id)['stock'] == 0
+
+    _set_cart(client, world, {world.product_id: 1})
+    assert client.post('/checkout', headers=world.buyer).status_code == 409
+
+
+def test_checkout_never_oversells_the_vendor(client, world):
+    client.patch(f'/products/{world.product_id}/inventory', headers=world.vendor, json={'vendor_stock': 1})
+    _set_cart(client, world, {world.product_id: 2})
+
+    response = client.post('/checkout', headers=world.buyer)
+    assert response.status_code == 409
+    assert response.json['out_of_stock'] == [world.product_id]
+    assert _stock(client, world, world.product_id)['stock'] == 100
+
+
+def test_checkout_gathers_sharded_stock(client, world):
+    # 5 over 3 shards is 2 + 2 + 1: no single shard holds 4
+    client.patch(f'/products/{world.product_id}/inventory', headers=world.vendor, json={'stock': 5, 'shards': 3})
+    _set_cart(client, world, {world.product_id: 4})
+    assert client.post('/checkout', headers=world.buyer).status_code == 201
+    assert _stock(client, world, world.product_id)['stock'] == 1
+
+    _set_cart(client, world, {world.product_id: 2})
+    assert client.post('/checkout', headers=world.buyer).status_code == 409
+    assert _stock(client, world, world.product_id)['stock'] == 1
+
+
+def test_reserve_is_conditional_on_the_stock_left(app, world, monkeypatch):
+    # the cart was read while there was stock, then another checkout took
+    # it: the decrement itself must refuse
+    import inventory
+    from models import db, Cart, Product
+
+    with app.app_context():
+        cart_id = Cart.query.filter_by(buyer_id=world.buyer_id).one().id
+        lines = inventory.cart_lines(cart_id)
+        monkeypatch.setattr(inventory, 'cart_lines', lambda cart_id: lines)
+        db.session.execute(update(Product).where(Product.id == world.product_id).values(stock=0, version=Product.version))
+        with pytest.raises(inventory.OutOfStockError) as error:
+            inventory.reserve_cart(cart_id)
+        assert error.value.product_ids == [world.product_id]
+        db.session.rollback()
+        db.session.remove()
+
+
+@pytest.mark.parametrize('shards', [0, 4])
+def test_adjust_cannot_go_below_zero(client, world, shards):
+    url = f'/products/{world.product_id}/inventory'
+    client.patch(url, headers=world.vendor, json={'stock': 5, 'shards': shards})
+
+    assert client.patch(url, headers=world.vendor, json={'adjust': -6}).status_code == 400
+    assert _stock(client, world, world.product_id)['stock'] == 5
+    assert client.patch(url, headers=world.vendor, json={'adjust': -5}).status_code == 200
+    assert client.patch(url, headers=world.vendor, json={'adjust': -1}).status_code == 400
+    assert client.patch(url, headers=world.vendor, json={'adjust': 3}).status_code == 200
+    assert _stock(client, world, world.product_id)['stock'] == 3
+
+
+def test_only_sellers_manage_inventory(app, client, world):
+    from models import Product, vendor_products
+
+    url = f'/products/{world.product_id}/inventory'
+    assert client.patch(url, headers=world.buyer, json={'stock': 1}).status_code == 403
+
+    # a product nobody sells yet is nobody's to stock
+    _write(app, vendor_products.delete().where(vendor_products.c.product_id == world.product_id))
+    assert client.patch(url, headers=world.vendor, json={'stock': 1}).status_code == 403
+    assert _scalar(app, select(Product.stock).where(Product.id == world.product_id)) == 100
@@ -0,0 +1,48 @@
+import pytest
+
+
+@pytest.fixture
+def subscription(app, make_world):
+    # a stream of the buyer's channel, fed by polls the test runs itself
+    from order_events import channels_for, order_events
+
+    world = make_world(2)
+    with app.app_context():
+        order_events.cursor = 0
+        subscription = order_events.broker.subscribe(channels_for(buyer_id=world.buyer_id))
+        yield world, subscription
+        order_events.broker.unsubscribe(subscription)
+        order_events.cursor = None
+
+
+def _publish(world, status):
+    from models import db, Order
+    from order_events import order_events
+
+    order = Order.query.filter_by(buyer_id=world.buyer_id).first()
+    order_events.publish('status', order, status=status)
+    db.session.commit()
+
+
+def _delivered(subscription):
+    from order_events import order_events
+
+    order_events.poll()
+    message = subscription.get(timeout=1)
+    return message and message['order']['status']
+
+
+def test_events_after_a_prune_still_arrive(subscription):
+    from models import db, OrderEvent
+    from order_events import order_events
+
+    world, subscription = subscription
+    _publish(world, 'Processing')
+    assert _delivered(subscription) == 'Processing'
+
+    # everything is past retention; ids must not start over below the cursor
+    order_events.prune(seconds=-60)
+    db.session.commit()
+    _publish(world, 'Shipped')
+    assert _delivered(subscription) == 'Shipped'
+    assert OrderEvent.query.count() == 2
@@ -0,0 +1,83 @@
+import pytest
+
+from pagination import encode_cursor
+
+
+SCALE = 12
+
+
+def _walk(client, world, query, limit):
+    # every page of /products?{query}, following X-Next-Cursor to the end
+    ids = []
+    cursor = None
+    while True:
+        url = f'/products?{query}&limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url, headers=world.buyer)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        ids.extend(product['id'] for product in response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            return ids
+
+
+# rating has one reviewed product and ties everywhere else, so the id
+# tiebreak decides most of those pages
+@pytest.mark.parametrize('sort', ['id', '-id', 'price', '-price', 'name', 'rating', '-rating'])
+def test_cursor_pages_match_one_big_page(client, make_world, sort):
+    world = make_world(SCALE)
+    everything = _walk(client, world, f'sort={sort}', limit=200)
+    assert len(everything) == SCALE
+
+    for limit in (1, 5, SCALE - 1):
+        assert _walk(client, world, f'sort={sort}', limit=limit) == everything
+
+
+def test_cursor_keeps_its_place_across_new_rows(client, make_world):
+    world = make_world(SCALE)
+    first = client.get('/products?sort=price&limit=4', headers=world.buyer)
+    cursor = first.headers['X-Next-Cursor']
+
+    # a product cheaper than the whole first page does not shift the next one
+    client.post('/products', headers=world.vendor, json={
+        'name': 'Cheap', 'price': 0.5, 'category': 'Fruit', 'image_url': 'https://example.com/cheap.png',
+    })
+    second = client.get(f'/products?sort=price&limit=4&cursor={cursor}', headers=world.buyer)
+    assert [product['price'] for product in second.json] == [14, 15, 16, 17]
+
+
+@pytest.mark.parametrize('position', [
+    {'sort': 'price', 'value': {'$gt': 0}, 'id': 1},
+    {'sort': 'price', 'value': 10, 'id': '1'},
+    {'sort': 'price', 'value': 10, 'id': 2 ** 70},
+    {'sort': 'price', 'value': True, 'id': 1},
+    {'sort': 'name', 'value': 10, 'id': 1},
+    {'sort': 'id', 'value': 1, 'id': 1},
+    {'sort': 'price', 'value': 10},
+    [1, 2],
+])
+def test_tampered_cursor_is_a_400(client, make_world, position):
+    world = make_world(3)
+    response = client.get(f'/products?sort=price&cursor={encode_cursor(position)}', headers=world.buyer)
+    assert response.status_code == 400, response.get_data(as_text=True)
+
+
+def test_garbage_cursor_is_a_400(client, make_world):
+    world = make_world(3)
+    response = client.get('/products?cursor=not-base64!', headers=world.buyer)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('query', ['min_price=abc', 'max_price=', 'min_rating=nan', 'max_price=inf'])
+def test_unparseable_filter_is_a_400(client, make_world, query):
+    world = make_world(3)
+    response = client.get(f'/products?{query}', headers=world.buyer)
+    assert response.status_code == 400, response.get_data(as_text=True)
+
+
+def test_filters_still_filter(client, make_world):
+    world = make_world(3)
+    everything = client.get('/products', headers=world.buyer).json
+    cheapest = min(product['price'] for product in everything)
+    response = client.get(f'/products?max_price={cheapest}', headers=world.buyer)
+    assert response.status_code == 200
+    assert [product['price'] for product in response.json] == [cheapest]
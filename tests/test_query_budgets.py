@@ -0,0 +1,148 @@
+import json
+from collections import namedtuple
+
+import pytest
+
+
+# Each route is run against a database with SMALL and with LARGE rows per
+# parent (see conftest.build_world). It must stay within its budget of SQL
+# statements at both sizes, and issue exactly as many at LARGE as at SMALL:
+# a count that grows with the data is an N+1 waiting to happen.
+SMALL = 3
+LARGE = 30
+
+# `path` and `body` are formatted with the world's ids; `role` picks the
+# token. `per_row` is for the few routes that do one statement per row on
+# purpose: they may grow by exactly that much per row, and `budget` is
+# then the count at LARGE.
+Case = namedtuple('Case', 'method path role budget status body per_row', defaults=(None, 0))
+
+CASES = [
+    Case('GET', '/', None, 0, 200),
+    Case('GET', '/metrics', None, 0, 200),
+    Case('POST', '/register', None, 4, 201,
+         {'username': 'new', 'email': 'new@example.com', 'password': 'password', 'user_type': 'both'}),
+    Case('POST', '/login', None, 1, 200, {'email': 'buyer@example.com', 'password': 'password'}),
+    Case('POST', '/logout', 'buyer', 2, 200),
+    Case('GET', '/products', 'buyer', 1, 200),
+    Case('GET', '/products?stream=1', 'buyer', 1, 200),
+    Case('GET', '/products?sort=rating&fields=id,name,rating', 'buyer', 1, 200),
+    Case('POST', '/products', 'vendor', 4, 201,
+         {'name': 'New', 'price': 1.5, 'category': 'Fruit', 'image_url': 'https://example.com/new.png'}),
+    Case('POST', '/products/bulk', 'vendor', 5, 200, 'bulk'),
+    Case('GET', '/products/search?q=product', 'buyer', 2, 200),
+    Case('GET', '/products/changes', 'buyer', 2, 200),
+    Case('GET', '/products/{product_id}', 'buyer', 1, 200),
+    Case('PATCH', '/products/{product_id}', 'vendor', 5, 200, {'price': 99}),
+    Case('DELETE', '/products/{other_product_id}', 'vendor', 12, 200),
+    Case('GET', '/products/{product_id}/inventory', 'buyer', 2, 200),
+    Case('PATCH', '/products/{product_id}/inventory', 'vendor', 6, 200, {'adjust': -1, 'vendor_stock': 5}),
+    Case('GET', '/cart', 'buyer', 2, 200),
+    Case('POST', '/cart', 'buyer', 1, 201),
+    Case('PATCH', '/cart', 'buyer', 4, 200,
+         {'add': [{'product_id': '{other_product_id}', 'quantity': 2}], 'remove': ['{product_id}']}),
+    Case('DELETE', '/cart', 'buyer', 4, 200),
+    Case('GET', '/orders', 'buyer', 1, 200),
+    Case('GET', '/orders?stream=1', 'buyer', 1, 200),
+    Case('POST', '/orders', 'buyer', 5, 201, {'vendor_id': '{vendor_id}', 'total_price': 12.5}),
+    Case('GET', '/orders/stream', 'buyer', 2, 200),
+    Case('POST', '/orders/stream/ticket', 'buyer', 0, 201),
+    # one conditional stock UPDATE per cart line, product and vendor stock
+    # (inventory.reserve_cart), taken in product id order against deadlocks
+    Case('POST', '/checkout', 'buyer', 68, 201, per_row=2),
+    Case('PATCH', '/orders/{order_id}', 'vendor', 7, 200, {'status': 'Processing'}),
+    Case('DELETE', '/orders/{order_id}', 'buyer', 4, 200),
+    Case('GET', '/products/{product_id}/reviews', 'vendor', 2, 200),
+    Case('GET', '/products/{product_id}/reviews?sort=-rating&fields=rating,buyer', 'vendor', 2, 200),
+    Case('POST', '/products/{product_id}/reviews', 'buyer', 5, 201, {'rating': 5, 'comment': 'Great'}),
+    Case('PATCH', '/products/{product_id}/reviews?review_id={review_id}', 'buyer', 4, 200, {'rating': 2}),
+    Case('DELETE', '/products/{product_id}/reviews?review_id={review_id}', 'buyer', 4, 200),
+    Case('GET', '/vendors/{vendor_id}/products', 'buyer', 3, 200),
+    Case('GET', '/vendors/{vendor_id}/products?sort=-price&fields=id,price', 'buyer', 3, 200),
+    Case('GET', '/vendors/{vendor_id}/analytics', 'vendor', 1, 200),
+    Case('POST', '/batch', 'buyer', 4, 200, {'requests': [
+        {'path': '/products/{product_id}'}, {'path': '/cart'}, {'path': '/orders'},
+    ]}),
+]
+
+
+def _fill(value, world):
+    # format ids into the strings of a body; a whole "{name}" becomes the int
+    if isinstance(value, dict):
+        return {key: _fill(item, world) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, world) for item in value]
+    if isinstance(value, str) and value.startswith('{') and value.endswith('}') and value[1:-1] in vars(world):
+        return vars(world)[value[1:-1]]
+    if isinstance(value, str):
+        return value.format(**vars(world))
+    return value
+
+
+def _request(client, case, world):
+    kwargs = {'headers': getattr(world, case.role) if case.role else {}}
+    if case.body == 'bulk':
+        # as many rows as the world has products: still one batch
+        kwargs['data'] = '\n'.join(
+            json.dumps({'name': f'Bulk {number}', 'price': 1, 'category': 'Fruit', 'image_url': 'u'})
+            for number in range(world.scale)
+        )
+        kwargs['content_type'] = 'application/x-ndjson'
+    elif case.body is not None:
+        kwargs['json'] = _fill(case.body, world)
+    return client.open(_fill(case.path, world), method=case.method, **kwargs)
+
+
+def _measure(client, make_world, count_queries, case, scale):
+    world = make_world(scale)
+    with count_queries() as counter:
+        response = _request(client, case, world)
+        # streamed bodies run their queries while being read
+        body = response.get_data(as_text=True)
+        # what a WSGI server does once the body is sent; ends event streams
+        response.close()
+    assert response.status_code == case.status, f"{case.method} {case.path} at {scale} rows: {body}"
+    return counter
+
+
+@pytest.mark.parametrize('case', CASES, ids=lambda case: f'{case.method} {case.path}')
+def test_query_budget(client, make_world, count_queries, case):
+    small = _measure(client, make_world, count_queries, case, SMALL)
+    large = _measure(client, make_world, count_queries, case, LARGE)
+
+    assert large.count - small.count == case.per_row * (LARGE - SMALL), (
+        f"{case.method} {case.path} ran {small.count} statements with {SMALL} rows and "
+        f"{large.count} with {LARGE}:\n" + '\n'.join(large.statements)
+    )
+    assert large.count <= case.budget, (
+        f"{case.method} {case.path} ran {large.count} statements, budget {case.budget}:\n"
+        + '\n'.join(large.statements)
+    )
+
+
+def test_every_route_has_a_budget(app):
+    covered = {(case.method, case.path.split('?')[0]) for case in CASES}
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == 'static':
+            continue
+        # '/products/<int:product_id>' -> '/products/{product_id}'
+        path = rule.rule
+        for argument in rule.arguments:
+            path = path.replace(f'<int:{argument}>', '{%s}' % argument).replace(f'<{argument}>', '{%s}' % argument)
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            if not any(method == covered_method and _same_route(path, covered_path)
+                       for covered_method, covered_path in covered):
+                missing.append(f'{method} {rule.rule}')
+    assert not missing, "Routes without a query budget in CASES: " + ', '.join(sorted(missing))
+
+
+def _same_route(rule_path, case_path):
+    # the cases name their ids after the world ('{other_product_id}'), the
+    # rules after the view argument ('{product_id}')
+    rule_parts = rule_path.strip('/').split('/')
+    case_parts = case_path.strip('/').split('/')
+    return len(rule_parts) == len(case_parts) and all(
+        rule_part == case_part or (rule_part.startswith('{') and case_part.startswith('{'))
+        for rule_part, case_part in zip(rule_parts, case_parts)
+    )
@@ -0,0 +1,139 @@
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limit
+from rate_limit import MemoryStore, SQLiteStore, caller_of, parse_rate
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path, monkeypatch):
+    # both stores, on a clock the test moves by hand
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, 'time', SimpleNamespace(monotonic=clock, time=clock))
+    if request.param == 'memory':
+        store = MemoryStore()
+    else:
+        store = SQLiteStore(str(tmp_path / 'buckets.db'))
+    store.clock = clock
+    return store
+
+
+def _takes(store, key, capacity, rate, times):
+    return [store.take(key, capacity, rate)[0] for _ in range(times)]
+
+
+def test_bucket_starts_full_and_empties(store):
+    assert _takes(store, 'a', 3, 1.0, 4) == [True, True, True, False]
+
+
+def test_bucket_refills_at_its_rate(store):
+    _takes(store, 'a', 2, 0.5, 2)
+    store.clock.advance(1)
+    # half a token is not enough
+    assert store.take('a', 2, 0.5)[0] is False
+    store.clock.advance(1)
+    allowed, tokens = store.take('a', 2, 0.5)
+    assert allowed is True
+    assert tokens == pytest.approx(0)
+
+
+def test_refused_take_keeps_the_refill(store):
+    _takes(store, 'a', 1, 1.0, 1)
+    store.clock.advance(0.6)
+    assert store.take('a', 1, 1.0)[0] is False
+    store.clock.advance(0.6)
+    assert store.take('a', 1, 1.0)[0] is True
+
+
+def test_bucket_never_holds_more_than_its_capacity(store):
+    _takes(store, 'a', 3, 1.0, 3)
+    store.clock.advance(3600)
+    assert _takes(store, 'a', 3, 1.0, 4) == [True, True, True, False]
+
+
+def test_buckets_are_per_key(store):
+    _takes(store, 'a', 1, 1.0, 1)
+    assert store.take('a', 1, 1.0)[0] is False
+    assert store.take('b', 1, 1.0)[0] is True
+
+
+def test_evicted_bucket_starts_full(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, 'time', SimpleNamespace(monotonic=clock, time=clock))
+    store = MemoryStore(max_size=2)
+    for key in 'abc':
+        store.take(key, 1, 1.0)
+    assert list(store.buckets) == ['b', 'c']
+    assert store.take('a', 1, 1.0)[0] is True
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('10/minute', (10, 10 / 60)),
+    ('1/second', (1, 1.0)),
+    ('24/day', (24, 24 / 86400)),
+])
+def test_parse_rate(spec, expected):
+    assert parse_rate(spec) == expected
+
+
+@pytest.mark.parametrize('spec', ['10', '0/minute', '-1/minute', 'ten/minute', '10/fortnight'])
+def test_parse_rate_rejects(spec):
+    with pytest.raises(ValueError):
+        parse_rate(spec)
+
+
+@pytest.fixture
+def limited(app, monkeypatch):
+    # rate limiting on, with buckets of its own
+    from rate_limit import rate_limiter
+
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_STORAGE', 'memory')
+    monkeypatch.setattr(rate_limiter, 'store', None)
+    return rate_limiter
+
+
+def test_a_limited_request_decodes_its_token_once(client, make_world, limited, monkeypatch):
+    from flask_jwt_extended import JWTManager
+
+    world = make_world(2)
+    decoded = []
+    decode = JWTManager._decode_jwt_from_config
+
+    def counting(self, *args, **kwargs):
+        decoded.append(args[0])
+        return decode(self, *args, **kwargs)
+    monkeypatch.setattr(JWTManager, '_decode_jwt_from_config', counting)
+
+    assert client.get('/cart', headers=world.buyer).status_code == 200
+    assert len(decoded) == 1
+
+
+def test_buckets_are_per_user(app, client, make_world, limited, monkeypatch):
+    world = make_world(2)
+    monkeypatch.setitem(app.config, 'RATE_LIMITS', dict(app.config['RATE_LIMITS'], cart='2/minute'))
+
+    assert [client.get('/cart', headers=world.buyer).status_code for _ in range(3)] == [200, 200, 429]
+    # someone else, and the same client without a token, have buckets of their own
+    assert client.get('/cart', headers=world.both).status_code != 429
+    assert client.get('/cart').status_code == 401
+
+
+def test_tokens_from_before_the_users_table_have_buckets_of_their_own():
+    assert caller_of({'id': 5, 'user_type': 'buyer', 'buyer_id': 9, 'vendor_id': None}) == 'user:5'
+    # the same number is a buyer profile id here, not users.id 5
+    assert caller_of({'id': 5, 'user_type': 'buyer'}) == 'buyer:5'
+    assert caller_of({'id': 5, 'user_type': 'vendor'}) == 'vendor:5'
@@ -0,0 +1,113 @@
+import pytest
+from sqlalchemy import update
+
+
+@pytest.fixture
+def world(app, make_world, monkeypatch):
+    # the rest of the suite runs with the cache off, so it measures the database
+    from response_cache import response_cache
+
+    monkeypatch.setitem(app.config, 'RESPONSE_CACHE_SIZE', 1024)
+    world = make_world(3)
+    response_cache.clear()
+    yield world
+    response_cache.clear()
+
+
+def _write(app, statement):
+    from models import db
+
+    with app.app_context():
+        db.session.execute(statement)
+        db.session.commit()
+        db.session.remove()
+
+
+def _rename_quietly(app, product_id, name):
+    # a write that neither invalidates nor moves the catalog version, so
+    # only a cached response can still show the old name
+    from models import Product
+
+    _write(app, update(Product).where(Product.id == product_id).values(name=name, version=Product.version))
+
+
+def test_second_read_is_a_hit(app, client, world):
+    url = f'/products/{world.product_id}'
+    first = client.get(url, headers=world.buyer)
+    _rename_quietly(app, world.product_id, 'Renamed')
+    second = client.get(url, headers=world.buyer)
+
+    assert second.status_code == 200
+    assert second.json['name'] == first.json['name'] == 'Product 0'
+    assert second.headers['ETag'] == first.headers['ETag']
+
+
+def test_list_pages_are_cached_too(app, client, world):
+    first = client.get('/products?sort=price', headers=world.buyer)
+    _rename_quietly(app, world.product_id, 'Renamed')
+    assert client.get('/products?sort=price', headers=world.buyer).json == first.json
+    # a different query string is a different entry
+    assert client.get('/products?sort=price&limit=10', headers=world.buyer).json[0]['name'] == 'Renamed'
+
+
+def test_matching_etag_is_a_304(client, world):
+    url = f'/products/{world.product_id}'
+    etag = client.get(url, headers=world.buyer).headers['ETag']
+
+    response = client.get(url, headers=dict(world.buyer, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+    response = client.get(url, headers=dict(world.buyer, **{'If-None-Match': '"something-else"'}))
+    assert response.status_code == 200
+
+
+def test_product_write_is_a_miss(client, world):
+    url = f'/products/{world.product_id}'
+    etag = client.get(url, headers=world.buyer).headers['ETag']
+    client.get('/products?sort=price', headers=world.buyer)
+
+    assert client.patch(url, headers=world.vendor, json={'name': 'Patched'}).status_code == 200
+    response = client.get(url, headers=dict(world.buyer, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.json['name'] == 'Patched'
+    assert response.headers['ETag'] != etag
+    assert client.get('/products?sort=price', headers=world.buyer).json[0]['name'] == 'Patched'
+
+
+def test_review_is_a_miss(client, world):
+    url = f'/products/{world.other_product_id}'
+    assert client.get(url, headers=world.buyer).json['rating']['count'] == 0
+    client.get('/products?sort=-rating', headers=world.buyer)
+
+    response = client.post(f'{url}/reviews', headers=world.buyer, json={'rating': 5, 'comment': 'Great'})
+    assert response.status_code == 201
+    assert client.get(url, headers=world.buyer).json['rating']['count'] == 1
+    # the listing by rating now starts with the product rated 5
+    assert client.get('/products?sort=-rating', headers=world.buyer).json[0]['id'] == world.other_product_id
+
+
+def test_write_by_another_process_is_a_miss(app, client, world):
+    # no invalidate() reaches this process; the catalog version still moves
+    from models import Product
+
+    url = f'/products/{world.product_id}'
+    client.get(url, headers=world.buyer)
+    _write(app, update(Product).where(Product.id == world.product_id).values(name='Elsewhere'))
+    assert client.get(url, headers=world.buyer).json['name'] == 'Elsewhere'
+
+
+def test_response_built_before_a_write_is_not_stored(app, world):
+    from models import Product
+    from response_cache import response_cache
+
+    url = f'/products/{world.product_id}'
+    with app.test_request_context(url):
+        # this request reads the catalog, then a write lands and another
+        # request sees it before this one stores its now stale response
+        assert response_cache.get() is None
+        _write(app, update(Product).where(Product.id == world.product_id).values(name='Newer'))
+        with app.test_request_context(url):
+            response_cache.get()
+        response_cache.set(app.response_class('{"name": "Product 0"}', mimetype='application/json'))
+    assert not response_cache.entries
@@ -0,0 +1,30 @@
+import pytest
+
+from pagination import encode_cursor
+
+
+def test_search_pages_through_every_match(client, make_world):
+    world = make_world(5)
+    ids = []
+    url = '/products/search?q=product&limit=2'
+    while url:
+        response = client.get(url, headers=world.buyer)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        ids.extend(product['id'] for product in response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        url = cursor and f'/products/search?q=product&limit=2&cursor={cursor}'
+    assert sorted(ids) == sorted(set(ids)) and len(ids) == 5
+
+
+@pytest.mark.parametrize('position', [
+    {'offset': 2 ** 70},
+    {'offset': 2 ** 63},
+    {'offset': -1},
+    {'offset': True},
+    {'offset': '2'},
+    [2],
+])
+def test_tampered_offset_is_a_400(client, make_world, position):
+    world = make_world(2)
+    response = client.get(f'/products/search?q=product&cursor={encode_cursor(position)}', headers=world.buyer)
+    assert response.status_code == 400, response.get_data(as_text=True)
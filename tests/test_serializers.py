@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+
+def test_json_provider_matches_the_stdlib(app):
+    from flask.json.provider import DefaultJSONProvider
+
+    stdlib = DefaultJSONProvider(app)
+    data = {'b': [1, 2.5, None, True], 'a': 'é', 'nested': {'z': 1, 'y': 2}}
+    assert json.loads(app.json.dumps(data)) == json.loads(stdlib.dumps(data))
+    assert list(json.loads(app.json.dumps(data))) == ['a', 'b', 'nested']
+
+
+def test_large_integers_are_read_as_integers(app):
+    value = app.json.loads('{"id": 1180591620717411303424}')['id']
+    assert value == 2 ** 70 and isinstance(value, int)
+
+
+@pytest.mark.parametrize('body', [
+    {'add': [{'product_id': 2 ** 70, 'quantity': 1}]},
+    {'add': [{'product_id': 1, 'quantity': 2 ** 64}]},
+    {'product_ids': [-2 ** 63 - 1]},
+])
+def test_oversized_integers_in_a_body_are_a_400(client, make_world, body):
+    world = make_world(2)
+    # sent as text: the encoder itself refuses integers beyond 64 bits
+    response = client.patch('/cart', headers=world.buyer, data=json.dumps(body), content_type='application/json')
+    assert response.status_code == 400, response.get_data(as_text=True)